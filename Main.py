@@ -1,62 +1,94 @@
-import sqlite3
 import uuid
-from aiogram import Bot, Dispatcher, types
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from aiogram.filters import Command
+from aiogram import BaseMiddleware, Bot, Dispatcher, Router, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, \
+    FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.methods import AnswerCallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.fsm.storage.memory import MemoryStorage
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-
-API_TOKEN = "API_KEY"
-bot = Bot(token=API_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-
-
-def init_db():
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        user_id TEXT PRIMARY KEY,
-        list_id TEXT
-    )''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS task_lists (
-        list_id TEXT PRIMARY KEY
-    )''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS tasks (
-        task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        list_id TEXT,
-        task TEXT,
-        description TEXT,
-        status TEXT,
-        created_at TEXT,
-        reminder_time TEXT,
-        reminded INTEGER DEFAULT 0,
-        completed_at TEXT,
-        FOREIGN KEY (list_id) REFERENCES task_lists(list_id)
-    )''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS list_members (
-        list_id TEXT,
-        user_id TEXT,
-        PRIMARY KEY (list_id, user_id),
-        FOREIGN KEY (list_id) REFERENCES task_lists(list_id),
-        FOREIGN KEY (user_id) REFERENCES users(user_id)
-    )''')
-
-    conn.commit()
-    conn.close()
-
-
-init_db()
+import contextlib
+import csv
+import functools
+import io
+import json
+import os
+import re
+import signal
+import socket
+import tempfile
+import time
+from repository import STATUS_CODES
+from sqlite_repository import SQLiteRepository
+from memory_repository import MemoryRepository
+from scheduler import ReminderScheduler
+from outbox import OutboundQueue, send_priority, BULK, BACKLOG
+from cache import LRUCache, MembershipCache
+from digest import DigestBatcher
+from callbacks import Action, CallbackRouter, encode
+from recurrence import parse_rule, describe_rule, next_occurrence
+from throttle import Throttle
+from metrics import Registry, HandlerMetrics, QueryMetrics, LoopWatchdog, LAG_BUCKETS, serve as serve_metrics
+from webhook import run_webhook
+from config import load_config
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Importing this module only defines handlers and metrics. The bot, its
+# network session and the storage backend are set up by create_app(), so
+# tools and extra workers pay for what they use. Handlers only talk to the
+# TaskRepository interface and never see SQL.
+config = None
+bot = None
+outbox = None
+repo = None
+membership = None
+dp = None
+scheduler = None
+reminder_digest = None
+
+router = Router()
+metrics = Registry()
+query_metrics = QueryMetrics(metrics)
+keyboards = LRUCache(10000)
+callback_router = CallbackRouter(fixed_args=3)
+reminder_lag = metrics.histogram("bot_reminder_lag_seconds", "Delay between a reminder's due time and its delivery.",
+                                 buckets=LAG_BUCKETS)
+
+
+def handler_name(event, data):
+    if isinstance(event, types.CallbackQuery):
+        handler, _ = callback_router.resolve(event.data)
+        return handler.__name__ if handler else None
+
+
+handler_metrics = HandlerMetrics(metrics, handler_name)
+router.message.middleware(handler_metrics)
+router.callback_query.middleware(handler_metrics)
+
+
+class InFlight(BaseMiddleware):
+    def __init__(self):
+        self.count = 0
+
+    async def __call__(self, handler, event, data):
+        self.count += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+
+    async def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.count and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+
+in_flight = InFlight()
 
 
 class ToDoStates(StatesGroup):
@@ -64,9 +96,10 @@ class ToDoStates(StatesGroup):
     adding_description = State()
     editing_task = State()
     editing_description = State()
-    changing_status = State()
     deleting_task = State()
     setting_reminder = State()
+    searching = State()
+    importing = State()
 
 
 STATUS_OPTIONS = {
@@ -75,55 +108,299 @@ STATUS_OPTIONS = {
     "completed": "Выполнена"
 }
 
+STATUS_LABELS = {STATUS_CODES[key]: label for key, label in STATUS_OPTIONS.items()}
+STATUS_KEYS = {code: key for key, code in STATUS_CODES.items()}
+STATUS_LOOKUP = {**STATUS_CODES, **{label.lower(): STATUS_CODES[key] for key, label in STATUS_OPTIONS.items()}}
+
+PAGE_SIZE = 10
+SEARCH_TERMS = 8
+IMPORT_LIMIT = 1000
+IMPORT_FILE_LIMIT = 1024 * 1024
+
+# Throttle cost per handler; anything not listed costs one token.
+THROTTLE_COSTS = {
+    "list_tasks": 3,
+    "show_completed": 3,
+    "turn_active_page": 2,
+    "turn_completed_page": 2,
+    "turn_search_page": 2,
+    "cmd_search": 3,
+    "process_search": 3,
+    "process_task_title": 2,
+    "process_import": 10,
+    "cmd_export": 10,
+}
+
+EXPORT_FIELDS = ["task", "description", "status", "created_at", "completed_at", "reminder_time"]
+DIGEST_ITEMS = 20
+
+
+def format_items(lines, header, total=None):
+    shown = lines[:DIGEST_ITEMS]
+    rest = (len(lines) if total is None else total) - len(shown)
+    text = [header, *shown]
+    if rest > 0:
+        text.append(f"… и ещё {rest}")
+    return "\n".join(text)
+
+
+async def send_reminder_digest(user_id, task_texts):
+    send_priority.set(BULK)
+    if len(task_texts) == 1:
+        text = f"⏰ Напоминание: {task_texts[0]}"
+    else:
+        text = format_items([f"• {shorten(task_text)}" for task_text in task_texts],
+                            f"⏰ Напоминания ({len(task_texts)}):")
+
+    try:
+        await bot.send_message(user_id, text)
+        return True
+    except Exception as e:
+        print(f"Ошибка при отправке напоминания: {e}")
+        return False
+
+
+async def deliver_reminder(task_id, reminder_time, user_id, task_text, lease):
+    if not lease["held"]:
+        return
+
+    # A failed send is not recorded and the reminder is left unfinished, so it
+    # is reclaimed for this member once the lease runs out.
+    if not await reminder_digest.add(user_id, task_text):
+        lease["held"] = False
+        return
+
+    if not await repo.record_delivery(task_id, reminder_time, user_id, WORKER_ID,
+                                      int(time.time()) + config.reminder_lease):
+        lease["held"] = False
+
+
+async def send_reminder(task_id, due):
+    send_priority.set(BULK)
+    now = int(time.time())
+    claim = await repo.claim_reminder(task_id, now, WORKER_ID, now + config.reminder_lease)
+
+    if claim is None:
+        return
 
-async def reminder_check():
+    list_id, task_text, reminder_time, reminder_rule, delivered = claim
+    reminder_lag.observe(max(time.time() - reminder_time, 0))
+    # Read fresh rather than from the cache: another process may have handled a
+    # /join or /leave for this list moments ago.
+    users = [user_id for user_id in await repo.list_members(list_id) if user_id not in delivered]
+
+    lease = {"held": True}
+    await asyncio.gather(*(deliver_reminder(task_id, reminder_time, user_id, task_text, lease)
+                           for user_id in users))
+
+    if lease["held"]:
+        next_time = next_occurrence(reminder_rule, reminder_time, int(time.time())) if reminder_rule else None
+        if await repo.finish_reminder(task_id, WORKER_ID, next_time) and next_time:
+            scheduler.schedule(task_id, next_time)
+
+
+async def watch_reminders():
+    # Keeps this worker's leases alive, picks up reminders set by other worker
+    # processes and reclaims the ones whose owner died before finishing them.
+    while True:
+        await asyncio.sleep(config.reminder_sweep_interval)
+        await repo.renew_reminder_leases(WORKER_ID, int(time.time()) + config.reminder_lease)
+        now = int(time.time())
+        for task_id, reminder_time in await repo.claimable_reminders(now, config.reminder_sweep_interval,
+                                                                     stale_before(now)):
+            scheduler.schedule(task_id, reminder_time)
+
+
+def stale_before(now):
+    return now - config.reminder_stale_after if config.reminder_stale_after else None
+
+
+async def run_bounded(job, items, limit):
+    items = iter(items)
+
+    async def worker():
+        for item in items:
+            await job(*item)
+
+    await asyncio.gather(*(worker() for _ in range(limit)))
+
+
+catch_up_remaining = 0
+
+
+async def send_missed_reminders(user_id, count, task_texts):
+    # Below fresh reminders and interactive replies in the outbox.
+    send_priority.set(BACKLOG)
+    await send_notification(user_id, format_items([f"• {shorten(task_text)}" for task_text in task_texts],
+                                                  f"⏰ Пока бот был недоступен, пропущено напоминаний: {count}",
+                                                  count))
+
+
+async def catch_up_reminders(before):
+    # Reminders that went stale while no worker was running are not fired one
+    # by one. They are claimed in keyset batches with bounded concurrency, each
+    # member gets one message listing what they missed, and only then are the
+    # reminders finished: a crash in between repeats the notice rather than
+    # losing it, and the sweep keeps the claimed leases alive meanwhile. This
+    # means the leases on the whole backlog are held at once, from the first
+    # batch until every notice is out; other workers skip those reminders
+    # until then. The backlog gauge counts a reminder down when it is
+    # finished, or at once if another worker holds it.
+    global catch_up_remaining
+    catch_up_remaining = await repo.count_overdue_reminders(before)
+    missed = {}
+    claimed = []
+
+    async def claim(task_id, due):
+        now = int(time.time())
+        claim = await repo.claim_reminder(task_id, now, WORKER_ID, now + config.reminder_lease)
+        if claim is None:
+            return
+
+        list_id, task_text, reminder_time, reminder_rule, delivered = claim
+        claimed.append((task_id, next_occurrence(reminder_rule, reminder_time, now) if reminder_rule else None))
+        for user_id in await repo.list_members(list_id):
+            if user_id in delivered:
+                continue
+            entry = missed.setdefault(user_id, [0, []])
+            entry[0] += 1
+            if len(entry[1]) < DIGEST_ITEMS:
+                entry[1].append(task_text)
+
+    async def finish(task_id, next_time):
+        global catch_up_remaining
+        if await repo.finish_reminder(task_id, WORKER_ID, next_time) and next_time:
+            scheduler.schedule(task_id, next_time)
+        catch_up_remaining = max(catch_up_remaining - 1, 0)
+
+    after = None
+    while True:
+        batch = await repo.overdue_reminders(before, config.reminder_catchup_batch, after)
+        if not batch:
+            break
+        held = len(claimed)
+        await run_bounded(claim, batch, config.reminder_catchup_concurrency)
+        catch_up_remaining = max(catch_up_remaining - (len(batch) - (len(claimed) - held)), 0)
+        after = batch[-1][::-1]
+
+    await run_bounded(send_missed_reminders, ((user_id, count, task_texts)
+                                              for user_id, (count, task_texts) in missed.items()),
+                      config.reminder_catchup_concurrency)
+    await run_bounded(finish, claimed, config.reminder_catchup_concurrency)
+    catch_up_remaining = 0
+    return len(claimed)
+
+
+async def catch_up():
+    # Fresh reminders keep going through the scheduler, which was loaded
+    # before this starts and never sees stale ones.
+    if not config.reminder_stale_after:
+        return
     while True:
-        now = datetime.now()
-        next_check_time = None
+        caught = await catch_up_reminders(stale_before(int(time.time())))
+        if caught:
+            print(f"Пропущенные напоминания обработаны: {caught}")
+        await asyncio.sleep(config.reminder_sweep_interval)
+
+
+metrics.gauge("bot_reminders_scheduled", "Reminders waiting in this worker's scheduler.",
+              collect=lambda: len(scheduler))
+metrics.gauge("bot_reminders_overdue", "Scheduled reminders already past their due time.",
+              collect=lambda: scheduler.overdue(time.time()))
+metrics.gauge("bot_reminders_in_flight", "Reminders currently being delivered.",
+              collect=lambda: scheduler.in_flight)
+metrics.gauge("bot_reminder_digest_pending", "Reminders waiting for their digest window.",
+              collect=lambda: len(reminder_digest))
+metrics.gauge("bot_reminder_backlog", "Stale overdue reminders still waiting for catch-up.",
+              collect=lambda: catch_up_remaining)
+metrics.gauge("bot_outbox_pending", "Outgoing API calls queued or in flight.", collect=lambda: len(outbox))
+
+
+def cache_stats():
+    return {**membership.stats(), "keyboards": keyboards.stats()}
+
+
+metrics.gauge("bot_cache_size", "Entries in the in-process caches.", ("cache",),
+              collect=lambda: {(name,): stats["size"] for name, stats in cache_stats().items()})
+metrics.counter("bot_cache_hits_total", "In-process cache hits.", ("cache",),
+                collect=lambda: {(name,): stats["hits"] for name, stats in cache_stats().items()})
+metrics.counter("bot_cache_misses_total", "In-process cache misses.", ("cache",),
+                collect=lambda: {(name,): stats["misses"] for name, stats in cache_stats().items()})
 
-        conn = sqlite3.connect('ToDo.db')
-        cursor = conn.cursor()
 
-        cursor.execute('''
-        SELECT task_id, list_id, task, reminder_time, reminded 
-        FROM tasks 
-        WHERE reminder_time IS NOT NULL 
-          AND reminded = 0
-          AND status != ?
-        ''', (STATUS_OPTIONS["completed"],))
+async def send_notification(user_id, text):
+    try:
+        await bot.send_message(user_id, text)
+    except Exception as e:
+        print(f"Ошибка при отправке уведомления: {e}")
+
+
+async def broadcast(list_id, text, exclude=None):
+    send_priority.set(BULK)
+    users = [user_id for user_id in await membership.list_members(list_id) if user_id != exclude]
+    await asyncio.gather(*(send_notification(user_id, text) for user_id in users))
+
 
-        tasks = cursor.fetchall()
+notifications = set()
 
-        for task_id, list_id, task_text, reminder_time_str, reminded in tasks:
-            reminder_time = datetime.strptime(reminder_time_str, "%Y-%m-%d %H:%M:%S")
 
-            if now >= reminder_time and not reminded:
-                cursor.execute('''
-                UPDATE tasks SET reminded = 1 WHERE task_id = ?
-                ''', (task_id,))
+def notify_members(list_id, actor, text):
+    # One fan-out per event: members come from the cached membership index in a
+    # single lookup and the sends run in the background through the outbox, so
+    # the acting user's reply doesn't wait on a large list.
+    task = asyncio.create_task(broadcast(list_id, f"👥 {actor.full_name}: {text}", str(actor.id)))
+    notifications.add(task)
+    task.add_done_callback(notifications.discard)
 
-                cursor.execute('''
-                SELECT user_id FROM list_members WHERE list_id = ?
-                ''', (list_id,))
 
-                users = cursor.fetchall()
+def shorten(text, limit=100):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
 
-                for (user_id,) in users:
-                    try:
-                        await bot.send_message(user_id, f"⏰ Напоминание: {task_text}")
-                    except Exception as e:
-                        print(f"Ошибка при отправке напоминания: {e}")
 
-            elif not reminded and (not next_check_time or reminder_time < next_check_time):
-                next_check_time = reminder_time
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%d.%m.%Y %H:%M")
 
-        conn.commit()
-        conn.close()
 
-        sleep_time = (next_check_time - datetime.now()).total_seconds() if next_check_time else 60
-        await asyncio.sleep(max(sleep_time, 1))
+def format_duration(seconds):
+    days, seconds = divmod(int(seconds), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    if days:
+        return f"{days} дн. {hours} ч"
+    if hours:
+        return f"{hours} ч {seconds // 60} мин"
+    return f"{seconds // 60} мин"
 
 
+def format_task(task_text, description, status, reminder_time, reminded, reminder_rule=None):
+    message_text = f"📌 {task_text}\nСтатус: {STATUS_LABELS[status]}"
+
+    if reminder_time:
+        message_text += f"\nНапоминание: {format_time(reminder_time)}"
+        if reminder_rule:
+            message_text += f" 🔁 {describe_rule(reminder_rule)}"
+        elif reminded:
+            message_text += " ✅"
+
+    if description:
+        message_text += f"\nОписание: {description}"
+
+    return message_text
+
+
+def cached_keyboard(build):
+    # Markups only depend on their arguments, so a card moving back and forth
+    # between menus reuses the same objects instead of rebuilding them.
+    def cached(*args):
+        key = (build.__name__, *args)
+        markup = keyboards.get(key, None)
+        if markup is None:
+            markup = build(*args)
+            keyboards.set(key, markup)
+        return markup
+    return cached
+
+
+@cached_keyboard
 def create_main_menu():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -135,75 +412,169 @@ def create_main_menu():
     )
 
 
-def create_task_keyboard(list_id, task_id):
+@cached_keyboard
+def create_task_keyboard(task_id):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✏ Редактировать", callback_data=f"edit_menu_{list_id}_{task_id}")],
-        [InlineKeyboardButton(text="⏰ Установить напоминание", callback_data=f"remind_{list_id}_{task_id}")],
-        [InlineKeyboardButton(text="🔄 Изменить статус", callback_data=f"status_{list_id}_{task_id}")],
-        [InlineKeyboardButton(text="❌ Удалить", callback_data=f"delete_task_{list_id}_{task_id}")]
+        [InlineKeyboardButton(text="✏ Редактировать", callback_data=encode(Action.EDIT_MENU, task_id))],
+        [InlineKeyboardButton(text="⏰ Установить напоминание", callback_data=encode(Action.REMIND, task_id))],
+        [InlineKeyboardButton(text="🔄 Изменить статус", callback_data=encode(Action.STATUS, task_id))],
+        [InlineKeyboardButton(text="❌ Удалить", callback_data=encode(Action.DELETE, task_id))]
     ])
 
 
-def create_edit_menu_keyboard(list_id, task_id):
+@cached_keyboard
+def create_edit_menu_keyboard(task_id):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📝 Редактировать название", callback_data=f"edit_name_{list_id}_{task_id}")],
-        [InlineKeyboardButton(text="📝 Редактировать описание", callback_data=f"edit_desc_{list_id}_{task_id}")],
-        [InlineKeyboardButton(text="↩ Назад", callback_data=f"back_{list_id}_{task_id}")]
+        [InlineKeyboardButton(text="📝 Редактировать название", callback_data=encode(Action.EDIT_NAME, task_id))],
+        [InlineKeyboardButton(text="📝 Редактировать описание", callback_data=encode(Action.EDIT_DESC, task_id))],
+        [InlineKeyboardButton(text="↩ Назад", callback_data=encode(Action.BACK, task_id))]
     ])
 
 
-def create_status_keyboard(list_id, task_id):
+@cached_keyboard
+def create_status_keyboard(task_id):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Не начата", callback_data=f"set_status_{list_id}_{task_id}_not_started")],
-        [InlineKeyboardButton(text="В процессе", callback_data=f"set_status_{list_id}_{task_id}_in_progress")],
-        [InlineKeyboardButton(text="Выполнена", callback_data=f"done_{list_id}_{task_id}")]
-    ], resize_keyboard=True)
+        [InlineKeyboardButton(text="Не начата",
+                              callback_data=encode(Action.SET_STATUS, task_id, STATUS_CODES["not_started"]))],
+        [InlineKeyboardButton(text="В процессе",
+                              callback_data=encode(Action.SET_STATUS, task_id, STATUS_CODES["in_progress"]))],
+        [InlineKeyboardButton(text="Выполнена", callback_data=encode(Action.DONE, task_id))],
+        [InlineKeyboardButton(text="↩ Назад", callback_data=encode(Action.BACK, task_id))]
+    ])
 
 
-@dp.message(Command("start"))
-async def cmd_start(message: Message):
+@cached_keyboard
+def create_confirm_done_keyboard(task_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Да, завершить", callback_data=encode(Action.CONFIRM_DONE, task_id)),
+         InlineKeyboardButton(text="↩ Нет", callback_data=encode(Action.CANCEL_DONE, task_id))]
+    ])
+
+
+@cached_keyboard
+def create_confirm_delete_keyboard(task_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🗑 Да, удалить", callback_data=encode(Action.CONFIRM_DELETE, task_id)),
+         InlineKeyboardButton(text="↩ Нет", callback_data=encode(Action.CANCEL_DELETE, task_id))]
+    ])
+
+
+async def edit_card(message, text=None, reply_markup=None):
+    # Task cards are edited in place; pressing the same button twice would
+    # otherwise fail with "message is not modified".
+    try:
+        if text is None:
+            await message.edit_reply_markup(reply_markup=reply_markup)
+        else:
+            await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+
+
+@router.message(Command("start"))
+async def cmd_start(message: Message, command: CommandObject):
     user_id = str(message.from_user.id)
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
+    if command.args and command.args.startswith("join_"):
+        return await join_by_token(message, command.args[len("join_"):])
 
-    cursor.execute('SELECT list_id FROM users WHERE user_id = ?', (user_id,))
-    user_data = cursor.fetchone()
+    if not await membership.list_id(user_id):
+        await repo.create_user_list(user_id)
+        membership.invalidate_user(user_id)
 
-    if not user_data:
-        list_id = str(uuid.uuid4())
+    return message.answer("Привет! Я бот для управления задачами. Выберите действие из меню:",
+                          reply_markup=create_main_menu())
 
-        cursor.execute('INSERT INTO task_lists (list_id) VALUES (?)', (list_id,))
-        cursor.execute('INSERT INTO users (user_id, list_id) VALUES (?, ?)', (user_id, list_id))
-        cursor.execute('INSERT INTO list_members (list_id, user_id) VALUES (?, ?)', (list_id, user_id))
 
-        conn.commit()
+def refresh_membership(user_id, *list_ids):
+    membership.invalidate_user(user_id)
+    for list_id in list_ids:
+        if list_id:
+            membership.invalidate_list(list_id)
 
-    conn.close()
 
-    await message.answer("Привет! Я бот для управления задачами. Выберите действие из меню:",
-                         reply_markup=create_main_menu())
+@router.message(Command("invite"))
+async def cmd_invite(message: Message):
+    user_id = str(message.from_user.id)
+    list_id = await membership.list_id(user_id)
+
+    if not list_id:
+        return message.answer("❌ Список задач не найден. Нажмите /start.")
 
+    token = await repo.create_invite(list_id, user_id, int(time.time()), config.invite_ttl)
+    me = await bot.me()
+    return message.answer(
+        f"👥 Пригласите участников в ваш список по ссылке:\n"
+        f"https://t.me/{me.username}?start=join_{token}\n\n"
+        f"или командой /join {token}\nСсылка действует {config.invite_ttl // 86400} дн."
+    )
 
-@dp.message(lambda msg: msg.text == "➕ Добавить")
+
+async def join_by_token(message: Message, token):
+    user_id = str(message.from_user.id)
+    joined = await repo.join_list(user_id, token.strip(), int(time.time()))
+
+    if joined is None:
+        return message.answer("❌ Приглашение не найдено или устарело.", reply_markup=create_main_menu())
+
+    list_id, old_list_id = joined
+    if list_id == old_list_id:
+        return message.answer("Вы уже участник этого списка.", reply_markup=create_main_menu())
+
+    refresh_membership(user_id, list_id, old_list_id)
+    notify_members(list_id, message.from_user, "присоединился к списку")
+    return message.answer("✅ Вы присоединились к общему списку задач.", reply_markup=create_main_menu())
+
+
+@router.message(Command("join"))
+async def cmd_join(message: Message, command: CommandObject):
+    if not command.args:
+        return message.answer("Использование: /join <код приглашения>")
+
+    return await join_by_token(message, command.args)
+
+
+@router.message(Command("leave"))
+async def cmd_leave(message: Message):
+    user_id = str(message.from_user.id)
+    left = await repo.leave_list(user_id)
+
+    if left is None:
+        return message.answer("❌ Вы не состоите в общем списке.", reply_markup=create_main_menu())
+
+    old_list_id, list_id, restored = left
+    refresh_membership(user_id, old_list_id, list_id)
+    notify_members(old_list_id, message.from_user, "покинул список")
+    if restored:
+        return message.answer("✅ Вы вышли из общего списка и вернулись к своему личному списку.",
+                              reply_markup=create_main_menu())
+    return message.answer("✅ Вы вышли из общего списка. Создан новый личный список.",
+                          reply_markup=create_main_menu())
+
+
+@router.message(lambda msg: msg.text == "➕ Добавить")
 async def add_task(message: Message, state: FSMContext):
-    await message.answer("Введите название задачи:")
     await state.set_state(ToDoStates.adding_title)
+    return message.answer("Введите название задачи:")
 
 
-@dp.message(ToDoStates.adding_title)
+@router.message(ToDoStates.adding_title)
 async def process_task_title(message: Message, state: FSMContext):
     if message.text.strip() in ["➕ Добавить", "📋 Список", "✅ Выполненные"]:
-        await message.answer(
+        return message.answer(
             "Текст не может совпадать с текстом кнопки. Пожалуйста, введите другое название:")
-        return
+
+    if "\n" in message.text.strip():
+        await state.clear()
+        return await import_tasks(message, parse_lines(message.text))
 
     await state.update_data(title=message.text.strip())
-    await message.answer("Теперь введите описание задачи (или нажмите /skip чтобы пропустить):")
     await state.set_state(ToDoStates.adding_description)
+    return message.answer("Теперь введите описание задачи (или нажмите /skip чтобы пропустить):")
 
 
-@dp.message(ToDoStates.adding_description)
+@router.message(ToDoStates.adding_description)
 async def process_task_description(message: Message, state: FSMContext):
     if message.text.strip() in ["➕ Добавить", "📋 Список", "✅ Выполненные"]:
         await message.answer(
@@ -216,21 +587,9 @@ async def process_task_description(message: Message, state: FSMContext):
 
     user_id = str(message.from_user.id)
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT list_id FROM users WHERE user_id = ?', (user_id,))
-    list_id = cursor.fetchone()[0]
-
-    cursor.execute('''
-    INSERT INTO tasks (list_id, task, description, status, created_at, reminder_time, reminded)
-    VALUES (?, ?, ?, ?, ?, NULL, 0)
-    ''', (list_id, title, description, STATUS_OPTIONS["not_started"], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    list_id = await membership.list_id(user_id)
 
-    task_id = cursor.lastrowid
-
-    conn.commit()
-    conn.close()
+    task_id = await repo.add_task(list_id, title, description, STATUS_CODES["not_started"], int(time.time()))
 
     message_text = f"✅ Задача добавлена:\n📌 {title}\nСтатус: {STATUS_OPTIONS['not_started']}"
     if description:
@@ -238,217 +597,370 @@ async def process_task_description(message: Message, state: FSMContext):
 
     await message.answer(
         message_text,
-        reply_markup=create_task_keyboard(list_id, task_id)
+        reply_markup=create_task_keyboard(task_id)
     )
     await state.clear()
+    notify_members(list_id, message.from_user, f"добавил задачу «{shorten(title, 50)}»")
 
 
-@dp.message(lambda msg: msg.text == "📋 Список")
-async def list_tasks(message: Message):
-    user_id = str(message.from_user.id)
+def parse_lines(text):
+    tasks = []
+    for line in text.splitlines():
+        title, _, description = line.partition("|")
+        if title.strip():
+            tasks.append((title.strip(), description.strip(), STATUS_CODES["not_started"]))
+    return tasks
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
 
-    cursor.execute('SELECT list_id FROM users WHERE user_id = ?', (user_id,))
-    user_data = cursor.fetchone()
+def parse_record(title, description="", status=""):
+    title = str(title or "").strip()
+    if not title:
+        return None
+    code = STATUS_LOOKUP.get(str(status or "").strip().lower(), STATUS_CODES["not_started"])
+    return title, str(description or "").strip(), code
 
-    if not user_data:
-        await message.answer("📭 Список пуст или не найден. Добавьте новую задачу.", reply_markup=create_main_menu())
-        conn.close()
-        return
 
-    list_id = user_data[0]
+def parse_csv(text):
+    reader = csv.reader(io.StringIO(text))
+    first = next(reader, None)
+    if first is None:
+        return []
+
+    header = [column.strip().lower() for column in first]
+    if "task" in header:
+        columns = [header.index(name) if name in header else None for name in ("task", "description", "status")]
+        rows = reader
+    else:
+        columns = [0, 1, 2]
+        rows = [first, *reader]
+
+    tasks = []
+    for row in rows:
+        values = [row[i] if i is not None and i < len(row) else "" for i in columns]
+        record = parse_record(*values)
+        if record:
+            tasks.append(record)
+    return tasks
+
+
+def parse_json(text):
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("tasks", [])
+    if not isinstance(data, list):
+        raise ValueError("expected a list of tasks")
+
+    tasks = []
+    for item in data:
+        if isinstance(item, dict):
+            record = parse_record(item.get("task") or item.get("title"), item.get("description"), item.get("status"))
+        else:
+            record = parse_record(item)
+        if record:
+            tasks.append(record)
+    return tasks
 
-    cursor.execute('''
-    SELECT task_id, task, description, status, reminder_time, reminded 
-    FROM tasks 
-    WHERE list_id = ? AND status != ? 
-    ORDER BY 
-        CASE WHEN status = ? THEN 0 ELSE 1 END,
-        created_at
-    ''', (list_id, STATUS_OPTIONS["completed"], STATUS_OPTIONS["in_progress"]))
 
-    tasks = cursor.fetchall()
+async def import_tasks(message: Message, tasks):
+    list_id = await membership.list_id(str(message.from_user.id))
 
+    if not list_id:
+        return message.answer("❌ Список задач не найден. Нажмите /start.")
     if not tasks:
-        await message.answer("📭 Список пуст. Добавьте новую задачу.", reply_markup=create_main_menu())
-        conn.close()
-        return
+        return message.answer("❌ Не найдено ни одной задачи для импорта.", reply_markup=create_main_menu())
+    if len(tasks) > IMPORT_LIMIT:
+        return message.answer(f"❌ Слишком много задач: {len(tasks)}. За один раз можно добавить до {IMPORT_LIMIT}.",
+                              reply_markup=create_main_menu())
+
+    count = await repo.add_tasks(list_id, tasks, int(time.time()))
+    notify_members(list_id, message.from_user, f"добавил задач: {count}")
+    return message.answer(f"✅ Добавлено задач: {count}", reply_markup=create_main_menu())
+
+
+@router.message(Command("import"))
+async def cmd_import(message: Message, state: FSMContext):
+    await state.set_state(ToDoStates.importing)
+    return message.answer("Отправьте задачи по одной в строке (название | описание) "
+                          "или файл CSV/JSON. /cancel — отмена.")
+
+
+@router.message(ToDoStates.importing)
+async def process_import(message: Message, state: FSMContext):
+    if message.text in ["/cancel", "➕ Добавить", "📋 Список", "✅ Выполненные"]:
+        await state.clear()
+        return message.answer("Импорт отменён.", reply_markup=create_main_menu())
+
+    document = message.document
+    if document is None:
+        await state.clear()
+        return await import_tasks(message, parse_lines(message.text or ""))
+
+    if document.file_size and document.file_size > IMPORT_FILE_LIMIT:
+        return message.answer(f"❌ Файл слишком большой. Максимум {IMPORT_FILE_LIMIT // 1024} КБ.")
+
+    content = await bot.download(document)
+    name = (document.file_name or "").lower()
+    try:
+        text = content.getvalue().decode("utf-8-sig")
+        if name.endswith(".json") or document.mime_type == "application/json":
+            tasks = parse_json(text)
+        elif name.endswith(".txt"):
+            tasks = parse_lines(text)
+        else:
+            tasks = parse_csv(text)
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        return message.answer("❌ Не удалось прочитать файл. Нужен CSV или JSON в кодировке UTF-8.")
+
+    await state.clear()
+    return await import_tasks(message, tasks)
+
+
+def export_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else ""
+
+
+def write_export(path, rows):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_FIELDS)
+        for task_text, description, status, created_at, completed_at, reminder_time in rows:
+            writer.writerow([task_text, description or "", STATUS_KEYS.get(status, ""), export_time(created_at),
+                             export_time(completed_at), export_time(reminder_time)])
+            count += 1
+    return count
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message):
+    list_id = await membership.list_id(str(message.from_user.id))
+
+    if not list_id:
+        return message.answer("❌ Список задач не найден. Нажмите /start.")
+
+    fd, path = tempfile.mkstemp(prefix="todo-export-", suffix=".csv")
+    os.close(fd)
+    try:
+        count = await repo.export_tasks(list_id, functools.partial(write_export, path))
+        if not count:
+            return message.answer("📭 Список пуст, экспортировать нечего.")
+        await message.answer_document(FSInputFile(path, filename="tasks.csv"), caption=f"📤 Задач: {count}")
+    finally:
+        os.remove(path)
+
+
+def page_links(action, page, rows, has_more, anchor_id, backward):
+    has_prev = has_more if backward else anchor_id is not None
+    has_next = True if backward else has_more
 
-    for task in tasks:
-        task_id, task_text, description, status, reminder_time, reminded = task
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="◀", callback_data=encode(action, max(page - 1, 0), rows[0][0], 1)))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="▶", callback_data=encode(action, page + 1, rows[-1][0], 0)))
+    return buttons
 
-        message_text = f"📌 {task_text}\nСтатус: {status}"
 
+def render_task_rows(title, page, rows):
+    lines = [title]
+    buttons = []
+
+    for idx, (task_id, task_text, status, reminder_time, reminded) in enumerate(rows, page * PAGE_SIZE + 1):
+        line = f"{idx}. {shorten(task_text)} — {STATUS_LABELS[status]}"
         if reminder_time:
-            message_text += f"\nНапоминание: {reminder_time}"
-            if reminded:
-                message_text += " ✅"
+            line += " ✅" if reminded else " ⏰"
+        lines.append(line)
+        buttons.append(InlineKeyboardButton(text=str(idx), callback_data=encode(Action.OPEN, task_id)))
+
+    return lines, [buttons[i:i + 5] for i in range(0, len(buttons), 5)]
+
+
+def render_active_page(page, rows, has_more, anchor_id=None, backward=False):
+    lines, keyboard = render_task_rows(f"📋 Задачи (стр. {page + 1}):", page, rows)
+    nav = page_links(Action.PAGE_ACTIVE, page, rows, has_more, anchor_id, backward)
+    if nav:
+        keyboard.append(nav)
+
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def render_completed_page(page, rows, has_more, anchor_id=None, backward=False):
+    lines = [f"✅ Выполненные задачи (стр. {page + 1}):"]
 
+    for idx, (task_id, task_text, description, completed_at) in enumerate(rows, page * PAGE_SIZE + 1):
+        line = f"\n✅ {idx}. {shorten(task_text)}"
         if description:
-            message_text += f"\nОписание: {description}"
+            line += f"\nОписание: {shorten(description)}"
+        line += f"\n🕒 Завершено: {format_time(completed_at)}"
+        lines.append(line)
 
-        await message.answer(
-            message_text,
-            reply_markup=create_task_keyboard(list_id, task_id)
-        )
+    nav = page_links(Action.PAGE_DONE, page, rows, has_more, anchor_id, backward)
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=[nav] if nav else [])
+
+
+@router.message(lambda msg: msg.text == "📋 Список")
+async def list_tasks(message: Message):
+    user_id = str(message.from_user.id)
+
+    list_id = await membership.list_id(user_id)
 
-    conn.close()
+    if not list_id:
+        await message.answer("📭 Список пуст или не найден. Добавьте новую задачу.", reply_markup=create_main_menu())
+        return
 
+    tasks, has_more = await repo.active_page(list_id, PAGE_SIZE)
 
-@dp.callback_query(lambda call: call.data.startswith("edit_menu_"))
-async def edit_task_menu(callback: types.CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) == 4:
-        _, _, list_id, task_id = parts
-        await callback.message.answer("Выберите, что хотите изменить:",
-                                      reply_markup=create_edit_menu_keyboard(list_id, task_id))
+    if not tasks:
+        await message.answer("📭 Список пуст. Добавьте новую задачу.", reply_markup=create_main_menu())
+        return
+
+    message_text, keyboard = render_active_page(0, tasks, has_more)
+    await message.answer(message_text, reply_markup=keyboard)
 
 
-@dp.callback_query(lambda call: call.data.startswith("edit_name_"))
-async def edit_task_name(callback: types.CallbackQuery, state: FSMContext):
-    parts = callback.data.split("_")
-    if len(parts) == 4:
-        _, _, list_id, task_id = parts
-        await state.set_state(ToDoStates.editing_task)
-        await state.update_data(list_id=list_id, task_id=task_id)
-        await callback.message.answer("Введите новое название задачи:")
+@callback_router(Action.PAGE_ACTIVE)
+async def turn_active_page(callback: types.CallbackQuery, state: FSMContext, list_id, page, anchor_id, backward):
+    tasks, has_more = await repo.active_page(list_id, PAGE_SIZE, anchor_id, backward)
+    if not tasks:
+        page, anchor_id, backward = 0, None, False
+        tasks, has_more = await repo.active_page(list_id, PAGE_SIZE)
 
+    if not tasks:
+        await callback.message.edit_text("📭 Список пуст.")
+    else:
+        message_text, keyboard = render_active_page(page, tasks, has_more, anchor_id, backward)
+        await callback.message.edit_text(message_text, reply_markup=keyboard)
+    return callback.answer()
 
-@dp.callback_query(lambda call: call.data.startswith("edit_desc_"))
-async def edit_task_description(callback: types.CallbackQuery, state: FSMContext):
-    parts = callback.data.split("_")
-    if len(parts) == 4:
-        _, _, list_id, task_id = parts
-        await state.set_state(ToDoStates.editing_description)
-        await state.update_data(list_id=list_id, task_id=task_id)
-        await callback.message.answer("Введите новое описание задачи (или /delete чтобы удалить описание):")
 
+@callback_router(Action.PAGE_DONE)
+async def turn_completed_page(callback: types.CallbackQuery, state: FSMContext, list_id, page, anchor_id, backward):
+    tasks, has_more = await repo.completed_page(list_id, PAGE_SIZE, anchor_id, backward)
+    if not tasks:
+        page, anchor_id, backward = 0, None, False
+        tasks, has_more = await repo.completed_page(list_id, PAGE_SIZE)
 
-@dp.callback_query(lambda call: call.data.startswith("back_"))
-async def back_to_task(callback: types.CallbackQuery):
-    parts = callback.data.split("_")
-    if len(parts) == 3:
-        _, list_id, task_id = parts
+    if not tasks:
+        await callback.message.edit_text("📭 Список пуст.")
+    else:
+        message_text, keyboard = render_completed_page(page, tasks, has_more, anchor_id, backward)
+        await callback.message.edit_text(message_text, reply_markup=keyboard)
+    return callback.answer()
 
-        conn = sqlite3.connect('ToDo.db')
-        cursor = conn.cursor()
 
-        cursor.execute('''
-        SELECT task, description, status, reminder_time, reminded 
-        FROM tasks 
-        WHERE task_id = ? AND list_id = ?
-        ''', (task_id, list_id))
+@callback_router(Action.OPEN)
+async def open_task(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    task = await repo.get_task(list_id, task_id)
+    if not task:
+        return callback.answer("❌ Задача не найдена")
 
-        task = cursor.fetchone()
-        conn.close()
+    # The list message stays put; the card is sent once and then edited in place.
+    await callback.message.answer(format_task(*task), reply_markup=create_task_keyboard(task_id))
 
-        if task:
-            task_text, description, status, reminder_time, reminded = task
-            message_text = f"📌 {task_text}\nСтатус: {status}"
 
-            if reminder_time:
-                message_text += f"\nНапоминание: {reminder_time}"
-                if reminded:
-                    message_text += " ✅"
+@callback_router(Action.EDIT_MENU)
+async def edit_task_menu(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await edit_card(callback.message, reply_markup=create_edit_menu_keyboard(task_id))
 
-            if description:
-                message_text += f"\nОписание: {description}"
 
-            await callback.message.answer(
-                message_text,
-                reply_markup=create_task_keyboard(list_id, task_id)
-            )
-        else:
-            await callback.answer("❌ Задача не найдена")
+@callback_router(Action.EDIT_NAME)
+async def edit_task_name(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await state.set_state(ToDoStates.editing_task)
+    await state.update_data(list_id=list_id, task_id=task_id)
+    return callback.message.answer("Введите новое название задачи:")
+
+
+@callback_router(Action.EDIT_DESC)
+async def edit_task_description(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await state.set_state(ToDoStates.editing_description)
+    await state.update_data(list_id=list_id, task_id=task_id)
+    return callback.message.answer("Введите новое описание задачи (или /delete чтобы удалить описание):")
 
 
-@dp.message(ToDoStates.editing_task)
+@callback_router(Action.BACK)
+async def back_to_task(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    task = await repo.get_task(list_id, task_id)
+    if not task:
+        return callback.answer("❌ Задача не найдена")
+
+    # Re-rendered rather than just swapping the keyboard: the task may have been
+    # edited since the card was drawn.
+    await edit_card(callback.message, format_task(*task), create_task_keyboard(task_id))
+
+
+@router.message(ToDoStates.editing_task)
 async def process_edit_task(message: Message, state: FSMContext):
     data = await state.get_data()
     list_id = data.get("list_id")
     task_id = data.get("task_id")
     new_task_text = message.text.strip()
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    UPDATE tasks 
-    SET task = ? 
-    WHERE task_id = ? AND list_id = ?
-    ''', (new_task_text, task_id, list_id))
-
-    conn.commit()
-    conn.close()
+    updated = await repo.rename_task(list_id, task_id, new_task_text)
 
     await message.answer("✅ Название задачи обновлено.", reply_markup=create_main_menu())
     await state.clear()
+    if updated:
+        notify_members(list_id, message.from_user, f"переименовал задачу в «{shorten(new_task_text, 50)}»")
 
 
-@dp.message(ToDoStates.editing_description)
+@router.message(ToDoStates.editing_description)
 async def process_edit_description(message: Message, state: FSMContext):
     data = await state.get_data()
     list_id = data.get("list_id")
     task_id = data.get("task_id")
     new_description = message.text.strip() if message.text != "/delete" else ""
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-    UPDATE tasks 
-    SET description = ? 
-    WHERE task_id = ? AND list_id = ?
-    ''', (new_description, task_id, list_id))
-
-    conn.commit()
-    conn.close()
+    await repo.set_description(list_id, task_id, new_description)
 
     await message.answer("✅ Описание задачи обновлено.", reply_markup=create_main_menu())
     await state.clear()
 
 
-@dp.callback_query(lambda call: call.data.startswith("remind_"))
-async def set_reminder(callback_query: types.CallbackQuery, state: FSMContext):
-    _, list_id, task_id = callback_query.data.split("_")
-
+@callback_router(Action.REMIND)
+async def set_reminder(callback_query: types.CallbackQuery, state: FSMContext, list_id, task_id):
     await state.update_data(list_id=list_id, task_id=task_id)
-    await callback_query.message.answer("Введите время для напоминания в формате `DD-MM-YYYY HH:MM`:")
     await state.set_state(ToDoStates.setting_reminder)
+    return callback_query.message.answer(
+        "Введите время для напоминания в формате `DD-MM-YYYY HH:MM`.\n"
+        "Для повтора добавьте правило: ежедневно, еженедельно, по будням или каждые N ч.\n"
+        "Например: `01-09-2025 09:00 по будням`"
+    )
 
 
-@dp.message(ToDoStates.setting_reminder)
+@router.message(ToDoStates.setting_reminder)
 async def process_reminder_time(message: Message, state: FSMContext):
     user_data = await state.get_data()
     list_id = user_data.get("list_id")
     task_id = user_data.get("task_id")
 
+    date_part, time_part, rule_part = (message.text.split(maxsplit=2) + ["", ""])[:3]
+
     try:
-        reminder_time = datetime.strptime(message.text.strip(), "%d-%m-%Y %H:%M")
+        reminder_rule = parse_rule(rule_part)
+    except ValueError:
+        await message.answer("❌ Неизвестное правило повтора. Используйте: ежедневно, еженедельно, "
+                             "по будням или каждые N ч.\nПопробуйте снова:")
+        return
+
+    try:
+        reminder_time = datetime.strptime(f"{date_part} {time_part}", "%d-%m-%Y %H:%M")
         if reminder_time <= datetime.now():
             await message.answer("❌ Напоминание должно быть установлено на будущее время. Попробуйте снова:")
             return
 
-        reminder_time_str = reminder_time.strftime("%Y-%m-%d %H:%M:%S")
-
-        conn = sqlite3.connect('ToDo.db')
-        cursor = conn.cursor()
+        reminder_timestamp = int(reminder_time.timestamp())
 
-        cursor.execute('SELECT task FROM tasks WHERE task_id = ?', (task_id,))
-        task_text = cursor.fetchone()[0]
-
-        cursor.execute('''
-        UPDATE tasks 
-        SET reminder_time = ?, reminded = 0 
-        WHERE task_id = ? AND list_id = ?
-        ''', (reminder_time_str, task_id, list_id))
+        task_text = await repo.set_reminder(list_id, task_id, reminder_timestamp, reminder_rule)
+        if task_text is None:
+            await message.answer("❌ Задача не найдена.", reply_markup=create_main_menu())
+            await state.clear()
+            return
 
-        conn.commit()
-        conn.close()
+        scheduler.schedule(task_id, reminder_timestamp)
 
         formatted_time = reminder_time.strftime("%d.%m.%Y в %H:%M")
+        if reminder_rule:
+            formatted_time += f", повтор: {describe_rule(reminder_rule)}"
         await message.answer(
             f"✅ Напоминание для задачи \"{task_text}\" установлено на {formatted_time}.",
             reply_markup=create_main_menu()
@@ -459,175 +971,383 @@ async def process_reminder_time(message: Message, state: FSMContext):
         await message.answer("❌ Некорректный формат времени. Используйте формат ДД-ММ-ГГГГ ЧЧ:ММ\nПопробуйте снова:")
 
 
-@dp.callback_query(lambda call: call.data.startswith("status_"))
-async def change_status(callback: types.CallbackQuery, state: FSMContext):
-    _, list_id, task_id = callback.data.split("_")
+@callback_router(Action.STATUS)
+async def change_status(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await edit_card(callback.message, reply_markup=create_status_keyboard(task_id))
 
-    await state.update_data(list_id=list_id, task_id=task_id)
-    await callback.message.answer("Выберите новый статус задачи:",
-                                  reply_markup=create_status_keyboard(list_id, task_id))
-    await state.set_state(ToDoStates.changing_status)
 
+@callback_router(Action.SET_STATUS)
+async def set_status(callback: types.CallbackQuery, state: FSMContext, list_id, task_id, new_status):
+    if new_status in (STATUS_CODES["not_started"], STATUS_CODES["in_progress"]):
+        task = await repo.set_status(list_id, task_id, new_status)
 
-@dp.callback_query(lambda call: call.data.startswith("set_status_"))
-async def set_status(callback: types.CallbackQuery):
-    _, _, list_id, task_id, status_key = callback.data.split("_", 4)
+        if task:
+            await edit_card(callback.message, format_task(*task), create_task_keyboard(task_id))
+            notify_members(list_id, callback.from_user,
+                           f"«{shorten(task[0], 50)}» — {STATUS_LABELS[task[2]]}")
+        else:
+            return callback.answer("❌ Задача не найдена.")
+    else:
+        return callback.answer("❌ Некорректный статус.")
 
-    if status_key in STATUS_OPTIONS:
-        new_status = STATUS_OPTIONS[status_key]
 
-        conn = sqlite3.connect('ToDo.db')
-        cursor = conn.cursor()
+@callback_router(Action.DONE)
+async def mark_done(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await edit_card(callback.message, reply_markup=create_confirm_done_keyboard(task_id))
+    return callback.answer("Завершить эту задачу?")
 
-        cursor.execute('''
-        UPDATE tasks 
-        SET status = ? 
-        WHERE task_id = ? AND list_id = ?
-        ''', (new_status, task_id, list_id))
 
-        cursor.execute('''
-        SELECT task, description, status, reminder_time, reminded 
-        FROM tasks 
-        WHERE task_id = ? AND list_id = ?
-        ''', (task_id, list_id))
+@callback_router(Action.CONFIRM_DONE)
+async def process_confirm_done(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    task_text = await repo.complete_task(list_id, task_id, int(time.time()))
+    if task_text is None:
+        return callback.answer("❌ Задача не найдена")
 
-        task = cursor.fetchone()
-        conn.commit()
-        conn.close()
+    scheduler.cancel(task_id)
 
-        if task:
-            task_text, description, status, reminder_time, reminded = task
-            message_text = f"📌 {task_text}\nСтатус: {status}"
+    await edit_card(callback.message, f"✅ Задача завершена: {task_text}")
+    notify_members(list_id, callback.from_user, f"завершил задачу «{shorten(task_text, 50)}»")
 
-            await callback.message.edit_text(message_text)
-        else:
-            await callback.message.answer("❌ Задача не найдена.")
-    else:
-        await callback.message.answer("❌ Некорректный статус.")
 
+@callback_router(Action.CANCEL_DONE)
+async def process_cancel_done(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await edit_card(callback.message, reply_markup=create_task_keyboard(task_id))
 
-@dp.callback_query(lambda call: call.data.startswith("done_"))
-async def mark_done(callback: types.CallbackQuery):
-    _, list_id, task_id = callback.data.split("_")
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Да", callback_data=f"confirm_done_{list_id}_{task_id}"),
-         InlineKeyboardButton(text="Нет", callback_data=f"cancel_done_{list_id}_{task_id}")]
-    ])
-    await callback.message.answer("Вы уверены, что хотите завершить эту задачу?", reply_markup=keyboard)
+@router.message(lambda msg: msg.text == "✅ Выполненные")
+async def show_completed(message: Message):
+    user_id = str(message.from_user.id)
 
+    list_id = await membership.list_id(user_id)
 
-@dp.callback_query(lambda call: call.data.startswith("confirm_done_"))
-async def process_confirm_done(callback: types.CallbackQuery):
-    _, _, list_id, task_id = callback.data.split("_")
+    if not list_id:
+        await message.answer("📭 Нет выполненных задач или список задач не найден.", reply_markup=create_main_menu())
+        return
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
+    completed_tasks, has_more = await repo.completed_page(list_id, PAGE_SIZE)
 
-    cursor.execute('''
-    UPDATE tasks 
-    SET status = ?, completed_at = ? 
-    WHERE task_id = ? AND list_id = ?
-    ''', (STATUS_OPTIONS["completed"], datetime.now().strftime("%Y-%m-%d %H:%M:%S"), task_id, list_id))
+    if not completed_tasks:
+        await message.answer("📭 В этом списке нет выполненных задач.")
+        return
 
-    cursor.execute('SELECT task FROM tasks WHERE task_id = ?', (task_id,))
-    task_text = cursor.fetchone()[0]
+    message_text, keyboard = render_completed_page(0, completed_tasks, has_more)
+    await message.answer(message_text, reply_markup=keyboard)
 
-    conn.commit()
-    conn.close()
 
-    await callback.message.edit_text(f"✅ Задача завершена: {task_text}")
+def search_terms(text):
+    # The index folds ё into е; queries have to match.
+    return re.findall(r"\w+", text.lower().replace("ё", "е"))[:SEARCH_TERMS]
 
 
-@dp.callback_query(lambda call: call.data.startswith("cancel_done_"))
-async def process_cancel_done(callback: types.CallbackQuery):
-    await callback.message.edit_text("Завершение задачи отменено.")
+def render_search_page(text, page, rows, has_more):
+    lines, keyboard = render_task_rows(f"🔍 Поиск «{shorten(text, 50)}» (стр. {page + 1}):", page, rows)
 
+    nav = []
+    if page:
+        nav.append(InlineKeyboardButton(text="◀", callback_data=encode(Action.PAGE_SEARCH, page - 1)))
+    if has_more:
+        nav.append(InlineKeyboardButton(text="▶", callback_data=encode(Action.PAGE_SEARCH, page + 1)))
+    if nav:
+        keyboard.append(nav)
 
-@dp.message(lambda msg: msg.text == "✅ Выполненные")
-async def show_completed(message: Message):
-    user_id = str(message.from_user.id)
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
 
-    cursor.execute('SELECT list_id FROM users WHERE user_id = ?', (user_id,))
-    user_data = cursor.fetchone()
+async def show_search(message: Message, state: FSMContext, text):
+    list_id = await membership.list_id(str(message.from_user.id))
 
-    if not user_data:
-        await message.answer("📭 Нет выполненных задач или список задач не найден.", reply_markup=create_main_menu())
-        conn.close()
-        return
+    if not list_id:
+        return message.answer("📭 Список задач не найден.", reply_markup=create_main_menu())
 
-    list_id = user_data[0]
+    terms = search_terms(text)
+    if not terms:
+        return message.answer("❌ Введите слова для поиска.")
 
-    cursor.execute('''
-    SELECT task, description, completed_at 
-    FROM tasks 
-    WHERE list_id = ? AND status = ? 
-    ORDER BY completed_at DESC
-    ''', (list_id, STATUS_OPTIONS["completed"]))
+    # The query is kept in FSM data so page buttons only need to carry a page number.
+    await state.update_data(search=text)
+    tasks, has_more = await repo.search_tasks(list_id, terms, PAGE_SIZE, 0)
 
-    completed_tasks = cursor.fetchall()
-    conn.close()
+    if not tasks:
+        return message.answer("🔍 Ничего не найдено.", reply_markup=create_main_menu())
 
-    if not completed_tasks:
-        await message.answer("📭 В этом списке нет выполненных задач.")
-        return
+    message_text, keyboard = render_search_page(text, 0, tasks, has_more)
+    return message.answer(message_text, reply_markup=keyboard)
 
-    for idx, task in enumerate(completed_tasks, 1):
-        task_text, description, completed_at = task
-        message_text = f"✅ {idx}. {task_text}"
 
-        if description:
-            message_text += f"\nОписание: {description}"
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext):
+    if not command.args:
+        await state.set_state(ToDoStates.searching)
+        return message.answer("Введите текст для поиска:")
 
-        message_text += f"\n🕒 Завершено: {completed_at}"
+    return await show_search(message, state, command.args)
 
-        await message.answer(message_text)
 
+@router.message(ToDoStates.searching)
+async def process_search(message: Message, state: FSMContext):
+    await state.set_state(None)
+    return await show_search(message, state, message.text or "")
 
-@dp.callback_query(lambda call: call.data.startswith("delete_task_"))
-async def confirm_delete_task(callback: types.CallbackQuery):
-    _, _, list_id, task_id = callback.data.split("_")
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Да", callback_data=f"confirm_delete_{list_id}_{task_id}"),
-         InlineKeyboardButton(text="Нет", callback_data="cancel_delete")]
-    ])
-    await callback.message.answer("Вы уверены, что хотите удалить эту задачу?", reply_markup=keyboard)
+@callback_router(Action.PAGE_SEARCH)
+async def turn_search_page(callback: types.CallbackQuery, state: FSMContext, list_id, page):
+    text = (await state.get_data()).get("search")
+    if not text:
+        return callback.answer("❌ Поиск устарел, повторите /search")
 
+    tasks, has_more = await repo.search_tasks(list_id, search_terms(text), PAGE_SIZE, page * PAGE_SIZE)
+    if not tasks:
+        return callback.answer("🔍 Больше ничего не найдено.")
 
-@dp.callback_query(lambda call: call.data.startswith("confirm_delete_"))
-async def process_delete_task(callback: types.CallbackQuery):
-    _, _, list_id, task_id = callback.data.split("_")
+    message_text, keyboard = render_search_page(text, page, tasks, has_more)
+    await callback.message.edit_text(message_text, reply_markup=keyboard)
+    return callback.answer()
+
+
+@router.message(Command("summary"))
+async def cmd_summary(message: Message, command: CommandObject):
+    user_id = str(message.from_user.id)
+    arg = (command.args or "").strip().lower()
 
-    conn = sqlite3.connect('ToDo.db')
-    cursor = conn.cursor()
+    if not arg:
+        summary_at = await repo.summary_time(user_id)
+        if summary_at:
+            return message.answer(f"📊 Ежедневная сводка приходит в {datetime.fromtimestamp(summary_at):%H:%M}.\n"
+                                  "Изменить: /summary ЧЧ:ММ, отключить: /summary off")
+        return message.answer("📊 Ежедневная сводка отключена. Включить: /summary ЧЧ:ММ, например /summary 09:00")
 
-    cursor.execute('SELECT task FROM tasks WHERE task_id = ?', (task_id,))
-    task_text = cursor.fetchone()[0]
+    if arg in ("off", "выкл"):
+        summary_at = None
+    else:
+        try:
+            at = datetime.strptime(arg, "%H:%M")
+        except ValueError:
+            return message.answer("❌ Укажите время в формате ЧЧ:ММ, например /summary 09:00")
 
-    cursor.execute('DELETE FROM tasks WHERE task_id = ? AND list_id = ?', (task_id, list_id))
+        now = int(time.time())
+        summary_at = int(datetime.now().replace(hour=at.hour, minute=at.minute, second=0, microsecond=0).timestamp())
+        if summary_at <= now:
+            summary_at = next_occurrence("daily", summary_at, now)
 
-    conn.commit()
-    conn.close()
+    if not await repo.set_summary_time(user_id, summary_at):
+        return message.answer("❌ Сначала выполните /start")
 
-    await callback.message.edit_text(f"❌ Задача удалена: {task_text}")
+    if summary_at is None:
+        return message.answer("📊 Ежедневная сводка отключена.")
+    return message.answer(f"📊 Сводка будет приходить каждый день в {datetime.fromtimestamp(summary_at):%H:%M}.")
 
 
-@dp.callback_query(lambda call: call.data == "cancel_delete")
-async def cancel_delete_task(callback: types.CallbackQuery):
-    await callback.message.edit_text("Удаление отменено.")
+def format_summary(items):
+    lines = [f"⚠ {datetime.fromtimestamp(reminder_time):%d.%m %H:%M} {task_text}" if reminded
+             else f"• {datetime.fromtimestamp(reminder_time):%H:%M} {task_text}"
+             for task_text, reminder_time, reminded in items]
+    overdue = sum(reminded == 1 for _, _, reminded in items)
+    return format_items(lines, f"📊 Сводка на сегодня: запланировано {len(lines) - overdue}, просрочено {overdue}")
 
 
-async def main():
-    asyncio.create_task(reminder_check())
+async def send_summaries():
+    send_priority.set(BULK)
+    while True:
+        now = int(time.time())
+        day_end = int((datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0,
+                                                                    microsecond=0).timestamp())
+        summaries = await repo.claim_summaries(now, day_end,
+                                               lambda summary_at: next_occurrence("daily", summary_at, now))
+        await asyncio.gather(*(send_notification(user_id, format_summary(items))
+                               for user_id, items in summaries))
+        await asyncio.sleep(config.summary_interval)
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    list_id = await membership.list_id(str(message.from_user.id))
+    if not list_id:
+        return message.answer("📭 Список задач не найден.", reply_markup=create_main_menu())
+
+    row = await repo.list_stats(list_id)
+    in_progress, not_started, completed, archived, overdue, done_count, done_seconds = row or (0,) * 7
+
+    done = completed + archived
+    total = in_progress + not_started + done
+    if not total:
+        return message.answer("📊 В списке пока нет задач.")
+
+    lines = [
+        "📊 Статистика списка:",
+        f"Активные: {in_progress + not_started} (в процессе {in_progress}, не начаты {not_started})",
+        f"Выполнено: {done}" + (f" (в архиве {archived})" if archived else ""),
+        f"Процент выполнения: {done * 100 // total}%",
+        f"Просрочено: {overdue}",
+    ]
+    if done_count:
+        lines.append(f"Среднее время выполнения: {format_duration(done_seconds / done_count)}")
+    return message.answer("\n".join(lines))
+
+
+async def verify_list_stats():
+    if not config.stats_check_interval:
+        return
+    while True:
+        await asyncio.sleep(config.stats_check_interval)
+        drift = await repo.check_list_stats()
+        if drift:
+            print(f"Статистика списков пересчитана, расхождений: {drift}")
+
+
+async def maintain_archive():
+    # Moves old completed tasks out of the hot table and applies the optional
+    # retention policy. Work is split into small batches so each transaction
+    # stays short and interactive writes can interleave with it.
+    jobs = [(repo.archive_completed, config.archive_after_days), (repo.compact_archive, config.archive_compact_days),
+            (repo.purge_archive, config.archive_retention_days)]
+    while True:
+        for job, days in jobs:
+            if not days:
+                continue
+            before = int(time.time()) - days * 86400
+            while await job(before, config.archive_batch) >= config.archive_batch:
+                await asyncio.sleep(0)
+        await asyncio.sleep(config.archive_interval)
+
+
+@callback_router(Action.DELETE)
+async def confirm_delete_task(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await edit_card(callback.message, reply_markup=create_confirm_delete_keyboard(task_id))
+    return callback.answer("Удалить эту задачу?")
+
+
+@callback_router(Action.CONFIRM_DELETE)
+async def process_delete_task(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    task_text = await repo.delete_task(list_id, task_id)
+    if task_text is None:
+        return callback.answer("❌ Задача не найдена")
+
+    scheduler.cancel(task_id)
+
+    await edit_card(callback.message, f"❌ Задача удалена: {task_text}")
+    notify_members(list_id, callback.from_user, f"удалил задачу «{shorten(task_text, 50)}»")
+
+
+@callback_router(Action.CANCEL_DELETE)
+async def cancel_delete_task(callback: types.CallbackQuery, state: FSMContext, list_id, task_id):
+    await edit_card(callback.message, reply_markup=create_task_keyboard(task_id))
+
+
+@router.callback_query()
+async def route_callback(callback: types.CallbackQuery, state: FSMContext):
+    handler, args = callback_router.resolve(callback.data)
+    if handler is None:
+        return callback.answer("❌ Кнопка устарела")
+
+    list_id = await membership.list_id(str(callback.from_user.id))
+    if not list_id:
+        return callback.answer("❌ Список не найден")
+
+    # Handlers return an answer when they have something to say; otherwise the
+    # query is answered here so the client stops showing a spinner.
+    result = await handler(callback, state, list_id, *args)
+    if result is None:
+        return callback.answer()
+    if not isinstance(result, AnswerCallbackQuery):
+        await callback.answer()
+    return result
+
+
+def create_app(settings):
+    global config, bot, outbox, repo, membership, dp, scheduler, reminder_digest
+    # Handlers live on the module-level router, which aiogram lets join only
+    # one dispatcher; refuse a second app before touching any state.
+    if dp is not None:
+        raise RuntimeError("create_app() can only be called once per process")
+    config = settings
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url)) \
+        if config.telegram_api_url else None
+    bot = Bot(token=config.api_token, session=session)
+    outbox = OutboundQueue()
+    bot.session.middleware(outbox)
+
+    if config.backend == "memory":
+        repo = MemoryRepository()
+    else:
+        repo = SQLiteRepository(config.db_path, on_query=query_metrics, on_commit=query_metrics.commit)
+    membership = MembershipCache(repo, ttl=config.membership_ttl)
+
+    costs = dict(THROTTLE_COSTS)
+    for item in filter(None, config.throttle_costs.split(",")):
+        name, cost = item.split("=")
+        costs[name.strip()] = int(cost)
+    throttle = Throttle(metrics, config.throttle_rate, config.throttle_burst, config.throttle_delay, costs,
+                        handler_name)
+    router.message.middleware(throttle)
+    router.callback_query.middleware(throttle)
+
+    dp = Dispatcher(storage=repo.fsm_storage())
+    dp.update.outer_middleware(in_flight)
+    dp.include_router(router)
+
+    scheduler = ReminderScheduler(send_reminder)
+    # Reminders reaching the same user within the window go out as one message.
+    reminder_digest = DigestBatcher(send_reminder_digest, config.reminder_digest_window)
+    return dp
+
+
+async def shutdown(background):
+    # New work stops first; then everything already accepted is finished in
+    # dependency order: handlers and reminders feed the digest and the
+    # notifications, those feed the outbox, and the outbox needs the session.
+    for task in background:
+        task.cancel()
+    await in_flight.wait(config.shutdown_timeout)
+    await reminder_digest.drain()
+    await scheduler.drain(config.shutdown_timeout)
+    if notifications:
+        await asyncio.wait(notifications, timeout=config.shutdown_timeout)
+    await outbox.drain()
+    await dp.storage.close()
+    # Reminders still claimed by this worker are handed back now rather than
+    # when their lease runs out; members already reached are not sent them again.
+    await repo.release_reminder_leases(WORKER_ID)
+    await bot.session.close()
+    await repo.close()
+
+
+async def main(argv=None):
+    settings = load_config(argv)
+    if not settings.api_token:
+        raise SystemExit("API token is required: --api-token or API_TOKEN")
+    create_app(settings)
+
+    scheduler.load(await repo.pending_reminders(stale_before(int(time.time()))))
+    background = [asyncio.create_task(job()) for job in (scheduler.run, watch_reminders, catch_up,
+                                                         maintain_archive, send_summaries, verify_list_stats)]
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    watchdog = LoopWatchdog(metrics, config.watchdog_threshold)
+    watchdog.start()
+    metrics_server = await serve_metrics(metrics, config.metrics_host, config.metrics_port) \
+        if config.metrics_port else None
     try:
-        await dp.start_polling(bot)
+        if config.worker_mode == "reminders":
+            await stop.wait()
+        elif config.webhook_url:
+            await run_webhook(dp, bot, config.webhook_url, config.webhook_host, config.webhook_port,
+                              config.webhook_path, config.webhook_max_in_flight, config.webhook_secret, stop)
+        else:
+            # Polling installs its own SIGINT/SIGTERM handlers; the session is
+            # closed by shutdown() once the outbox is empty.
+            await dp.start_polling(bot, close_bot_session=False)
     finally:
-        await bot.session.close()
+        watchdog.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await shutdown(background)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
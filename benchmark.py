@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Update
+
+from callbacks import Action, decode, encode
+from fake_telegram import FakeSession, FakeTelegramAPI, make_update
+
+WORDS = ["купить", "позвонить", "отчёт", "молоко", "встреча", "письмо", "код", "ревью", "спорт", "врач"]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "total_ms": sum(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p90_ms": percentile(values, 90) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values, default=0.0) * 1000,
+    }
+
+
+class Benchmark:
+    def __init__(self, app, users, tasks, concurrency, seed, reminder_spread, outbox=False):
+        self.app = app
+        self.outbox = outbox
+        self.users = users
+        self.tasks = tasks
+        self.concurrency = concurrency
+        self.reminder_spread = reminder_spread
+        self.rng = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+
+        self.update_latency = []
+        self.update_errors = defaultdict(int)
+        self.handler_latency = defaultdict(list)
+        self.handler_errors = defaultdict(int)
+        self.db_time = {"read": [], "write": []}
+        self.fire_lag = []
+        self.delivery_lag = []
+        self.last_task = {}
+        self.reminder_tasks = {}
+        self.reminder_due = {}
+
+    def on_request(self, method, params):
+        text = params.get("text", "")
+        if method == "sendMessage" and text.startswith("✅ Задача добавлена"):
+            markup = json.loads(params["reply_markup"])
+            action, args = decode(markup["inline_keyboard"][0][0]["callback_data"])
+            if action == Action.EDIT_MENU:
+                self.last_task[int(params["chat_id"])] = args[0]
+        elif text.startswith("⏰"):
+            due = self.reminder_due.get(int(params["chat_id"]))
+            if due is not None:
+                self.delivery_lag.append(time.time() - due)
+
+    async def time_handler(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        if isinstance(event, CallbackQuery):
+            routed, _ = self.app.callback_router.resolve(event.data)
+            if routed is not None:
+                name = routed.__name__
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.handler_errors[name] += 1
+            raise
+        finally:
+            self.handler_latency[name].append(time.perf_counter() - started)
+
+    def time_db(self, on_query):
+        def timed(kind, query, waited, elapsed):
+            self.db_time[kind].append(elapsed)
+            if on_query is not None:
+                on_query(kind, query, waited, elapsed)
+        return timed
+
+    def install(self):
+        app = self.app
+        app.bot.session = FakeSession(FakeTelegramAPI(), on_request=self.on_request)
+        if self.outbox:
+            app.bot.session.middleware(app.outbox)
+        app.dp.message.middleware(self.time_handler)
+        app.dp.callback_query.middleware(self.time_handler)
+        # Only the SQLite backend has queries to time; the in-memory one has no I/O.
+        db = getattr(app.repo, "db", None)
+        if db is not None:
+            db.on_query = self.time_db(db.on_query)
+
+        fire = app.scheduler.fire
+
+        async def timed_fire(task_id, due):
+            self.fire_lag.append(time.time() - due)
+            await fire(task_id, due)
+
+        app.scheduler.fire = timed_fire
+
+    def message(self, user_id, text):
+        return Update.model_validate(make_update(next(self.update_ids), user_id, text),
+                                     context={"bot": self.app.bot})
+
+    def callback(self, user_id, action, *args):
+        return Update.model_validate({
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.message_ids)),
+                "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+                "chat_instance": str(user_id),
+                "data": encode(action, *args),
+                "message": {
+                    "message_id": next(self.message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "-",
+                },
+            },
+        }, context={"bot": self.app.bot})
+
+    async def feed(self, update):
+        started = time.perf_counter()
+        try:
+            result = await self.app.dp.feed_update(self.app.bot, update)
+            # Polling and webhook mode both execute a returned method; mirror that.
+            if isinstance(result, TelegramMethod):
+                await self.app.bot(result)
+        except Exception as e:
+            # A failed update is counted, not timed: its latency would pass for
+            # a real sample and flatter the percentiles.
+            self.update_errors[type(e).__name__] += 1
+            return
+        self.update_latency.append(time.perf_counter() - started)
+
+    async def user_session(self, user_id):
+        feed = self.feed
+        await feed(self.message(user_id, "/start"))
+
+        task_ids = []
+        for n in range(self.tasks):
+            await feed(self.message(user_id, "➕ Добавить"))
+            await feed(self.message(user_id, " ".join(self.rng.choices(WORDS, k=3)) + f" {n}"))
+            description = " ".join(self.rng.choices(WORDS, k=6)) if n % 2 else "/skip"
+            await feed(self.message(user_id, description))
+            task_ids.append(self.last_task.get(user_id))
+
+        await feed(self.message(user_id, "📋 Список"))
+
+        task_ids = [task_id for task_id in task_ids if task_id is not None]
+        if not task_ids:
+            return
+
+        task_id = task_ids[0]
+        await feed(self.callback(user_id, Action.OPEN, task_id))
+        await feed(self.callback(user_id, Action.STATUS, task_id))
+        await feed(self.callback(user_id, Action.SET_STATUS, task_id, self.app.STATUS_CODES["in_progress"]))
+
+        reminder_at = (datetime.now() + timedelta(minutes=5)).strftime("%d-%m-%Y %H:%M")
+        await feed(self.callback(user_id, Action.REMIND, task_id))
+        await feed(self.message(user_id, reminder_at))
+        self.reminder_tasks[user_id] = task_id
+
+        if len(task_ids) > 2:
+            await feed(self.callback(user_id, Action.DONE, task_ids[1]))
+            await feed(self.callback(user_id, Action.CONFIRM_DONE, task_ids[1]))
+            await feed(self.callback(user_id, Action.DELETE, task_ids[2]))
+            await feed(self.callback(user_id, Action.CONFIRM_DELETE, task_ids[2]))
+
+        await feed(self.message(user_id, "✅ Выполненные"))
+
+    async def run_users(self):
+        pending = iter(range(100000, 100000 + self.users))
+
+        async def worker():
+            for user_id in pending:
+                await self.user_session(user_id)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def run_reminders(self):
+        # Reminders set through the flow are minutes away; pull them forward so
+        # they come due over the next few seconds and measure how late they fire.
+        app = self.app
+        rows = list(self.reminder_tasks.items())
+        if not rows:
+            return 0
+
+        start = time.time() + 1
+        for i, (user_id, task_id) in enumerate(rows):
+            due = int(start + self.reminder_spread * i / len(rows))
+            self.reminder_due[user_id] = due
+            await app.repo.set_reminder(await app.membership.list_id(str(user_id)), task_id, due)
+            app.scheduler.schedule(task_id, due)
+
+        deadline = time.time() + self.reminder_spread + 30
+        while len(self.delivery_lag) < len(rows) and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        return len(rows)
+
+    async def run(self):
+        self.install()
+        runner = asyncio.create_task(self.app.scheduler.run())
+        try:
+            started = time.perf_counter()
+            await self.run_users()
+            elapsed = time.perf_counter() - started
+
+            reminders = await self.run_reminders()
+        finally:
+            runner.cancel()
+            await self.app.dp.storage.close()
+
+        return {
+            "users": self.users,
+            "tasks_per_user": self.tasks,
+            "concurrency": self.concurrency,
+            "updates": len(self.update_latency),
+            "elapsed_s": elapsed,
+            "updates_per_s": len(self.update_latency) / elapsed,
+            "update_latency": summarize(self.update_latency),
+            "update_errors": dict(self.update_errors),
+            "handlers": {name: dict(summarize(samples), errors=self.handler_errors[name])
+                         for name, samples in sorted(self.handler_latency.items())},
+            "db": {kind: summarize(samples) for kind, samples in self.db_time.items() if samples},
+            "reminders": {
+                "scheduled": reminders,
+                "delivered": len(self.delivery_lag),
+                "fire_lag": summarize(self.fire_lag),
+                "delivery_lag": summarize(self.delivery_lag),
+            },
+            "api_calls": dict(self.app.bot.session.telegram.calls),
+        }
+
+
+def print_report(report):
+    def row(name, stats, extra=""):
+        print(f"  {name:<28} {stats['count']:>8} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}{extra}")
+
+    print(f"users: {report['users']} x {report['tasks_per_user']} tasks, concurrency {report['concurrency']}")
+    print(f"updates: {report['updates']} in {report['elapsed_s']:.2f}s ({report['updates_per_s']:.0f}/s)")
+    print(f"  {'':<28} {'count':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    errors = report["update_errors"]
+    row("update (end to end)", report["update_latency"],
+        f"  errors: {sum(errors.values())} ({', '.join(f'{name} {count}' for name, count in errors.items())})"
+        if errors else "")
+    for name, stats in report["handlers"].items():
+        row(name, stats, f"  errors: {stats['errors']}" if stats["errors"] else "")
+    for kind, stats in report["db"].items():
+        row(f"db {kind} ({stats['total_ms'] / 1000:.2f}s total)", stats)
+
+    reminders = report["reminders"]
+    print(f"reminders: {reminders['delivered']}/{reminders['scheduled']} delivered")
+    row("fire lag", reminders["fire_lag"])
+    row("delivery lag", reminders["delivery_lag"])
+    print("api calls:", report["api_calls"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the bot's handlers with synthetic users")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tasks", type=int, default=3, help="tasks each user adds")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reminder-spread", type=float, default=5.0,
+                        help="seconds over which the reminders come due")
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite",
+                        help="storage backend; memory measures the handlers without any disk I/O")
+    parser.add_argument("--outbox", action="store_true",
+                        help="send through the rate-limited outbound queue")
+    parser.add_argument("--throttle", action="store_true",
+                        help="keep per-user throttling on; synthetic users are far faster than people")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="todo-bench-")
+
+    import Main
+    from config import load_config
+
+    # Other settings still come from the environment; the bot never reaches
+    # Telegram, so any well-formed token will do.
+    overrides = ["--backend", args.backend, "--db-path", os.path.join(workdir, "bench.db"),
+                 "--api-token", os.getenv("API_TOKEN", "123456:" + "A" * 35)]
+    if not args.throttle:
+        overrides += ["--throttle-rate", "0"]
+    Main.create_app(load_config(overrides))
+
+    async def run():
+        benchmark = Benchmark(Main, args.users, args.tasks, args.concurrency, args.seed, args.reminder_spread,
+                              args.outbox)
+        try:
+            return await benchmark.run()
+        finally:
+            await Main.outbox.drain()
+            await Main.repo.close()
+
+    report = asyncio.run(run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=_MISSING):
+        value, expires = self._data.get(key, (_MISSING, None))
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            value = _MISSING
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl if self.ttl else None)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class MembershipCache:
+    def __init__(self, repo, maxsize=100000, ttl=60):
+        # Invalidation only reaches the process that handled /join or /leave;
+        # the TTL bounds how long other workers keep a stale membership.
+        self.repo = repo
+        self.lists = LRUCache(maxsize, ttl)
+        self.members = LRUCache(maxsize, ttl)
+
+    async def list_id(self, user_id):
+        list_id = self.lists.get(user_id)
+        if list_id is _MISSING:
+            list_id = await self.repo.user_list(user_id)
+            self.lists.set(user_id, list_id)
+        return list_id
+
+    async def list_members(self, list_id):
+        members = self.members.get(list_id)
+        if members is _MISSING:
+            members = await self.repo.list_members(list_id)
+            self.members.set(list_id, members)
+        return members
+
+    def invalidate_user(self, user_id):
+        self.lists.invalidate(user_id)
+
+    def invalidate_list(self, list_id):
+        self.members.invalidate(list_id)
+
+    def stats(self):
+        return {"user_lists": self.lists.stats(), "list_members": self.members.stats()}
@@ -0,0 +1,92 @@
+import base64
+import enum
+
+
+class Action(enum.IntEnum):
+    OPEN = 1
+    EDIT_MENU = 2
+    EDIT_NAME = 3
+    EDIT_DESC = 4
+    BACK = 5
+    REMIND = 6
+    STATUS = 7
+    SET_STATUS = 8
+    DONE = 9
+    CONFIRM_DONE = 10
+    CANCEL_DONE = 11
+    DELETE = 12
+    CONFIRM_DELETE = 13
+    CANCEL_DELETE = 14
+    PAGE_ACTIVE = 15
+    PAGE_DONE = 16
+    PAGE_SEARCH = 17
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        if pos >= len(data) or shift > 63:
+            raise ValueError("truncated callback payload")
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode(action, *args):
+    # One action byte followed by unsigned varints, base64url without padding:
+    # a task reference costs 1-5 bytes instead of a 36-char list UUID.
+    out = bytearray([action])
+    for arg in args:
+        _write_varint(out, int(arg))
+    return base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode()
+
+
+def decode(data):
+    try:
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (ValueError, TypeError) as e:
+        raise ValueError("malformed callback payload") from e
+    if not raw:
+        raise ValueError("empty callback payload")
+
+    action = Action(raw[0])
+    args = []
+    pos = 1
+    while pos < len(raw):
+        value, pos = _read_varint(raw, pos)
+        args.append(value)
+    return action, args
+
+
+class CallbackRouter:
+    def __init__(self, fixed_args=0):
+        # fixed_args: leading handler parameters supplied by the caller rather
+        # than decoded from the payload (callback, state, list_id, ...).
+        self.fixed_args = fixed_args
+        self.handlers = {}
+
+    def __call__(self, action):
+        def register(handler):
+            self.handlers[action] = (handler, handler.__code__.co_argcount - self.fixed_args)
+            return handler
+        return register
+
+    def resolve(self, data):
+        try:
+            action, args = decode(data or "")
+        except ValueError:
+            return None, []
+        handler, arity = self.handlers.get(action, (None, 0))
+        if handler is None or len(args) != arity:
+            return None, []
+        return handler, args
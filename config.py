@@ -0,0 +1,53 @@
+import argparse
+import os
+
+# name, type, default, help. Every option can be given on the command line
+# (--reminder-lease 30) or through the environment (REMINDER_LEASE=30); the
+# command line wins.
+OPTIONS = [
+    ("api_token", str, None, "Telegram bot token"),
+    ("telegram_api_url", str, None, "base URL of a self-hosted Bot API server"),
+    ("webhook_url", str, None, "public base URL; switches from polling to a webhook"),
+    ("webhook_host", str, "127.0.0.1", "address the webhook server listens on"),
+    ("webhook_port", int, 8080, "port the webhook server listens on"),
+    ("webhook_path", str, "/webhook", "path of the webhook endpoint"),
+    ("webhook_secret", str, None, "secret token Telegram sends with webhook requests"),
+    ("webhook_max_in_flight", int, 100, "updates processed concurrently in webhook mode"),
+    ("backend", str, "sqlite", "storage backend: sqlite, or memory for tests and benchmarks"),
+    ("db_path", str, "ToDo.db", "SQLite database file"),
+    ("worker_mode", str, "bot", "bot, or reminders for a worker that only delivers reminders"),
+    ("reminder_lease", int, 60, "seconds a claimed reminder stays reserved for its worker"),
+    ("reminder_sweep_interval", int, 10, "seconds between lease renewals and reminder sweeps"),
+    ("reminder_stale_after", int, 3600,
+     "reminders overdue longer than this are caught up in batches and collapsed into one message per user"),
+    ("reminder_catchup_batch", int, 500, "overdue reminders read per catch-up batch"),
+    ("reminder_catchup_concurrency", int, 8, "overdue reminders claimed or finished concurrently during catch-up"),
+    ("reminder_digest_window", float, 5, "seconds reminders to one user are batched into a digest"),
+    ("summary_interval", int, 60, "seconds between checks for due daily summaries"),
+    ("archive_after_days", int, 30, "move tasks completed this long ago to the archive"),
+    ("archive_compact_days", int, 0, "drop descriptions of archived tasks after this many days"),
+    ("archive_retention_days", int, 0, "delete archived tasks after this many days"),
+    ("archive_interval", int, 3600, "seconds between archive maintenance runs"),
+    ("archive_batch", int, 1000, "rows moved per archive transaction"),
+    ("stats_check_interval", int, 24 * 3600, "seconds between list statistics consistency checks, 0 to disable"),
+    ("membership_ttl", float, 60, "seconds other worker processes may keep a cached list membership"),
+    ("invite_ttl", int, 7 * 24 * 3600, "seconds an invite link stays valid"),
+    ("metrics_host", str, "127.0.0.1", "address of the Prometheus endpoint"),
+    ("metrics_port", int, 0, "port of the Prometheus endpoint, 0 to disable"),
+    ("watchdog_threshold", float, 0.25, "seconds of event loop stall that get logged"),
+    ("throttle_rate", float, 2, "tokens per second refilled in each user's bucket, 0 to disable throttling"),
+    ("throttle_burst", int, 20, "size of each user's token bucket"),
+    ("throttle_delay", float, 2, "longest a request is deferred before it is dropped instead"),
+    ("throttle_costs", str, "", "per-handler costs overriding the defaults, e.g. list_tasks=3,cmd_export=10"),
+    ("shutdown_timeout", float, 30, "seconds to wait for in-flight work on shutdown"),
+]
+
+
+def load_config(argv=None, environ=os.environ):
+    parser = argparse.ArgumentParser(description="ToDo list Telegram bot")
+    for name, kind, default, help in OPTIONS:
+        value = environ.get(name.upper())
+        parser.add_argument(f"--{name.replace('_', '-')}", type=kind,
+                            default=kind(value) if value is not None else default,
+                            help=f"{help} (env {name.upper()})")
+    return parser.parse_args(argv)
@@ -0,0 +1,141 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Database:
+    def __init__(self, path, readers=4, statement_cache_size=256, commit_window=0.001, max_batch=512,
+                 on_query=None, on_commit=None):
+        self.path = path
+        self.statement_cache_size = statement_cache_size
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        # on_query(kind, name, waited, elapsed) is called from the executor thread
+        # after every call, with the queue wait and run time in seconds;
+        # on_commit(size, elapsed) once per group-committed write batch.
+        self.on_query = on_query
+        self.on_commit = on_commit
+        self._pending = []
+        self._flusher = None
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        # SQLite allows a single writer at a time, so all writes share one thread
+        # while reads are spread over a small pool of WAL readers.
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # sqlite3 keeps a per-connection cache of prepared statements keyed by
+            # the SQL text, so long-lived connections reuse them across handlers.
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   cached_statements=self.statement_cache_size)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA busy_timeout = 5000')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _observe(self, kind, fn, submitted, started):
+        if self.on_query is not None:
+            self.on_query(kind, fn.__name__, started - submitted, time.perf_counter() - started)
+
+    def _run_read(self, fn, args, submitted):
+        conn = self._connect()
+        started = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._observe("read", fn, submitted, started)
+
+    def _run_batch(self, batch):
+        # Every write in the batch shares one transaction and one commit. Each runs
+        # inside its own savepoint, so a failing write is rolled back on its own
+        # and reported to its caller without taking the rest of the batch down.
+        conn = self._connect()
+        batch_started = time.perf_counter()
+        results = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for fn, args, submitted, _ in batch:
+                conn.execute('SAVEPOINT item')
+                started = time.perf_counter()
+                try:
+                    results.append((True, fn(conn, *args)))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO item')
+                    results.append((False, e))
+                finally:
+                    conn.execute('RELEASE item')
+                    self._observe("write", fn, submitted, started)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        if self.on_commit is not None:
+            self.on_commit(len(batch), time.perf_counter() - batch_started)
+        return results
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        try:
+            if self.commit_window:
+                await asyncio.sleep(self.commit_window)
+            # Writes that arrive while a batch is committing are picked up by the next one.
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                try:
+                    results = await loop.run_in_executor(self._writer, self._run_batch, batch)
+                except Exception as e:
+                    results = [(False, e)] * len(batch)
+
+                for (_, _, _, future), (ok, value) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._flusher = None
+
+    async def read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args, time.perf_counter())
+
+    async def write(self, fn, *args):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((fn, args, time.perf_counter(), future))
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush())
+        return await future
+
+    async def flush(self):
+        while self._flusher is not None:
+            await asyncio.shield(self._flusher)
+
+    async def fetchone(self, sql, params=()):
+        def fetchone(conn):
+            return conn.execute(sql, params).fetchone()
+        return await self.read(fetchone)
+
+    async def execute(self, sql, params=()):
+        def execute(conn):
+            return conn.execute(sql, params).rowcount
+        return await self.write(execute)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
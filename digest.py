@@ -0,0 +1,52 @@
+import asyncio
+
+
+class DigestBatcher:
+    def __init__(self, send, window):
+        # send(key, items) delivers one batch and returns whether it succeeded;
+        # every caller whose item went into that batch gets the same result.
+        self.send = send
+        self.window = window
+        self._pending = {}
+        self._flushing = set()
+
+    def __len__(self):
+        return sum(len(items) for items, _ in self._pending.values())
+
+    async def add(self, key, item):
+        if self.window <= 0:
+            return await self.send(key, [item])
+
+        batch = self._pending.get(key)
+        if batch is None:
+            loop = asyncio.get_running_loop()
+            batch = self._pending[key] = ([], loop.create_future())
+            loop.call_later(self.window, self._flush, key)
+        batch[0].append(item)
+        return await asyncio.shield(batch[1])
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        task = asyncio.create_task(self._deliver(key, *batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _deliver(self, key, items, future):
+        try:
+            result = await self.send(key, items)
+        except Exception as e:
+            result = False
+            print(f"Ошибка при отправке дайджеста: {e}")
+        if not future.done():
+            future.set_result(result)
+
+    async def drain(self):
+        # Sends whatever is still waiting for its window instead of dropping it;
+        # anything added afterwards goes out immediately.
+        self.window = 0
+        for key in list(self._pending):
+            self._flush(key)
+        if self._flushing:
+            await asyncio.wait(self._flushing)
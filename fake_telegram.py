@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiogram.client.session.base import BaseSession
+from aiohttp import ClientSession, TCPConnector, web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "ToDo", "username": "todo_bot"}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.files = {}
+        self._message_ids = itertools.count(1)
+
+    def _message(self, params):
+        chat_id = params.get("chat_id") or 0
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+        }
+        if params.get("text"):
+            message["text"] = params["text"]
+        if params.get("reply_markup"):
+            # Telegram only echoes inline keyboards back on the sent message.
+            markup = json.loads(params["reply_markup"])
+            if "inline_keyboard" in markup:
+                message["reply_markup"] = markup
+        if "document" in params:
+            message["document"] = {"file_id": "fake", "file_unique_id": "fake"}
+        return message
+
+    def result(self, method, params):
+        self.calls[method] += 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return []
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            return self._message(params)
+        if method == "getFile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_path": f"documents/{file_id}",
+                    "file_size": len(self.files.get(file_id, b""))}
+        return True
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    async def download(self, request):
+        content = self.files.get(request.match_info["path"].rsplit("/", 1)[-1])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content)
+
+    async def stats(self, request):
+        return web.json_response(dict(self.calls))
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+
+class FakeSession(BaseSession):
+    # In-process counterpart of the HTTP server: methods are serialized the way
+    # AiohttpSession would send them and answered by the same FakeTelegramAPI.
+    def __init__(self, api=None, latency=0.0, on_request=None):
+        super().__init__()
+        self.telegram = api or FakeTelegramAPI()
+        self.latency = latency
+        self.on_request = on_request
+
+    async def make_request(self, bot, method, timeout=None):
+        params = {}
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files={})
+            if value:
+                params[key] = value
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.on_request:
+            self.on_request(method.__api_method__, params)
+        result = self.telegram.result(method.__api_method__, params)
+        return self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result})).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield self.telegram.files.get(url.rsplit("/", 1)[-1], b"")
+
+    async def close(self):
+        pass
+
+
+def make_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "text": text,
+        },
+    }
+
+
+async def load(webhook_url, users, updates, concurrency, api_url=None):
+    update_ids = itertools.count(1)
+    texts = itertools.cycle(["/start", "📋 Список", "✅ Выполненные", "➕ Добавить", "Задача"])
+    latencies = []
+    inline = 0
+    queue = asyncio.Queue()
+    for i in range(updates):
+        queue.put_nowait(make_update(next(update_ids), 1000 + i % users, next(texts)))
+
+    async def worker(session):
+        nonlocal inline
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(webhook_url, json=update) as response:
+                body = await response.read()
+            latencies.append(time.perf_counter() - started)
+            if b"webhookBoundary" in body:
+                inline += 1
+
+    started = time.perf_counter()
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        print(f"updates: {updates} in {elapsed:.2f}s ({updates / elapsed:.0f}/s), inline replies: {inline}")
+        for p in (50, 90, 99):
+            print(f"p{p}: {latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000:.1f} ms")
+
+        if api_url:
+            async with session.get(f"{api_url}/stats") as response:
+                print("api calls:", await response.json())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8081)
+    serve.add_argument("--latency", type=float, default=0.0)
+
+    drive = commands.add_parser("load")
+    drive.add_argument("--webhook", default="http://127.0.0.1:8080/webhook")
+    drive.add_argument("--api", default="http://127.0.0.1:8081")
+    drive.add_argument("--users", type=int, default=1000)
+    drive.add_argument("--updates", type=int, default=10000)
+    drive.add_argument("--concurrency", type=int, default=100)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        web.run_app(FakeTelegramAPI(args.latency).create_app(), host=args.host, port=args.port)
+    else:
+        asyncio.run(load(args.webhook, args.users, args.updates, args.concurrency, args.api))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+import bisect
+import heapq
+import itertools
+import re
+import secrets
+import uuid
+from collections import defaultdict
+
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from repository import STATUS_CODES, TaskRepository
+
+COMPLETED = STATUS_CODES["completed"]
+
+
+class Task:
+    __slots__ = ("task_id", "list_id", "task", "description", "status", "created_at", "completed_at",
+                 "reminder_time", "reminded", "reminder_rule", "reminder_owner", "reminder_lease")
+
+    def __init__(self, task_id, list_id, task, description, status, created_at, completed_at=None):
+        self.task_id = task_id
+        self.list_id = list_id
+        self.task = task
+        self.description = description
+        self.status = status
+        self.created_at = created_at
+        self.completed_at = completed_at
+        self.reminder_time = None
+        self.reminded = 0
+        self.reminder_rule = None
+        self.reminder_owner = None
+        self.reminder_lease = None
+
+    def row(self):
+        return self.task, self.description, self.status, self.reminder_time, self.reminded, self.reminder_rule
+
+    def list_row(self):
+        return self.task_id, self.task, self.status, self.reminder_time, self.reminded
+
+    def done_row(self):
+        return self.task_id, self.task, self.description, self.completed_at
+
+    def reminder_pending(self):
+        return self.reminder_time is not None and not self.reminded and self.status != COMPLETED
+
+
+def words(text):
+    return re.findall(r"\w+", (text or "").lower().replace("ё", "е"))
+
+
+class MemoryRepository(TaskRepository):
+    # Same contract as SQLiteRepository, kept in dicts indexed by user, list
+    # and task. Sorted key lists stand in for the SQL indexes on open tasks,
+    # finished tasks (live and archived), completion time and pending
+    # reminders, and heaps order summaries and invite expiry. Nothing touches the disk, so flows can be driven at CPU
+    # speed.
+    def __init__(self):
+        self.users = {}
+        self.home_lists = {}
+        self.summary_at = {}
+        self.members = defaultdict(set)
+        self.invites = {}
+        self.tasks = {}
+        self.list_tasks = defaultdict(dict)
+        self.archive = {}
+        self.list_archive = defaultdict(dict)
+        self.deliveries = {}
+        self.leases = defaultdict(set)
+        self._task_ids = itertools.count(1)
+        self._active = defaultdict(list)
+        self._done = defaultdict(list)
+        self._completed = []
+        self._archived = []
+        self._compactable = []
+        self._pending = []
+        self._summaries = []
+        self._invite_expiry = []
+
+    # users, lists and members
+
+    async def user_list(self, user_id):
+        return self.users.get(user_id)
+
+    async def list_members(self, list_id):
+        return tuple(self.members.get(list_id, ()))
+
+    async def create_user_list(self, user_id):
+        if user_id in self.users:
+            return
+
+        list_id = str(uuid.uuid4())
+        self.users[user_id] = list_id
+        self.members[list_id].add(user_id)
+
+    async def create_invite(self, list_id, user_id, now, ttl):
+        while self._invite_expiry and self._invite_expiry[0][0] <= now:
+            _, token = heapq.heappop(self._invite_expiry)
+            self.invites.pop(token, None)
+
+        token = secrets.token_urlsafe(12)
+        self.invites[token] = (list_id, now + ttl)
+        heapq.heappush(self._invite_expiry, (now + ttl, token))
+        return token
+
+    async def join_list(self, user_id, token, now):
+        invite = self.invites.get(token)
+        if not invite or invite[1] <= now:
+            return None
+
+        list_id = invite[0]
+        old_list_id = self.users.get(user_id)
+        if old_list_id == list_id:
+            return list_id, old_list_id
+
+        if old_list_id is not None:
+            # A list only this user is in is kept to be given back on /leave.
+            if not self.members[old_list_id] - {user_id}:
+                self.home_lists[user_id] = old_list_id
+            if self.home_lists.get(user_id) == list_id:
+                del self.home_lists[user_id]
+            self.members[old_list_id].discard(user_id)
+        self.users[user_id] = list_id
+        self.members[list_id].add(user_id)
+        return list_id, old_list_id
+
+    async def leave_list(self, user_id):
+        old_list_id = self.users.get(user_id)
+        if old_list_id is None or not self.members[old_list_id] - {user_id}:
+            return None
+
+        list_id = self.home_lists.pop(user_id, None)
+        restored = list_id is not None
+        if not restored:
+            list_id = str(uuid.uuid4())
+        self.members[old_list_id].discard(user_id)
+        self.users[user_id] = list_id
+        self.members[list_id].add(user_id)
+        return old_list_id, list_id, restored
+
+    async def summary_time(self, user_id):
+        return self.summary_at.get(user_id)
+
+    async def set_summary_time(self, user_id, summary_at):
+        if user_id not in self.users:
+            return False
+
+        self.summary_at[user_id] = summary_at
+        if summary_at is not None:
+            heapq.heappush(self._summaries, (summary_at, user_id))
+        return True
+
+    async def claim_summaries(self, now, day_end, next_time):
+        due = []
+        while self._summaries and self._summaries[0][0] <= now:
+            summary_at, user_id = heapq.heappop(self._summaries)
+            # Entries are never removed when a time changes; stale ones are
+            # skipped here instead.
+            if self.summary_at.get(user_id) == summary_at:
+                due.append(user_id)
+                await self.set_summary_time(user_id, next_time(summary_at))
+
+        summaries = []
+        for user_id in sorted(due):
+            tasks = sorted((task for task in self.list_tasks[self.users[user_id]].values()
+                            if task.status != COMPLETED and task.reminder_time is not None
+                            and (task.reminded == 1 or task.reminder_time < day_end)),
+                           key=lambda task: (task.reminder_time, task.task_id))
+            if tasks:
+                summaries.append((user_id, [(task.task, task.reminder_time, task.reminded) for task in tasks]))
+        return summaries
+
+    # indexes
+
+    def _keys(self, task):
+        # Every sorted index the task belongs to, with its key there. A task
+        # is taken out with _unindex before a change to any of these fields
+        # and put back with _index afterwards.
+        if task.status < COMPLETED:
+            yield self._active[task.list_id], (task.status, task.created_at, task.task_id)
+            if task.reminder_pending():
+                yield self._pending, (task.reminder_time, task.task_id)
+            return
+
+        # Finished tasks page together with the archive, newest first.
+        yield self._done[task.list_id], (task.completed_at or 0, task.task_id)
+        if task.completed_at is None:
+            return
+        if self.archive.get(task.task_id) is not task:
+            yield self._completed, (task.completed_at, task.task_id)
+            return
+        yield self._archived, (task.completed_at, task.task_id)
+        if task.description is not None:
+            yield self._compactable, (task.completed_at, task.task_id)
+
+    def _done_task(self, list_id, task_id):
+        task = self.tasks.get(task_id) or self.archive.get(task_id)
+        return task if task is not None and task.list_id == list_id and task.status == COMPLETED else None
+
+    def _index(self, task):
+        for keys, key in self._keys(task):
+            bisect.insort(keys, key)
+
+    def _unindex(self, task):
+        for keys, key in self._keys(task):
+            del keys[bisect.bisect_left(keys, key)]
+
+    # tasks
+
+    def _add(self, list_id, title, description, status, created_at, completed_at=None):
+        task = Task(next(self._task_ids), list_id, title, description, status, created_at, completed_at)
+        self.tasks[task.task_id] = task
+        self.list_tasks[list_id][task.task_id] = task
+        self._index(task)
+        return task.task_id
+
+    async def add_task(self, list_id, title, description, status, created_at):
+        return self._add(list_id, title, description, status, created_at)
+
+    async def add_tasks(self, list_id, tasks, now):
+        for title, description, status in tasks:
+            self._add(list_id, title, description, status, now, now if status == COMPLETED else None)
+        return len(tasks)
+
+    def _task(self, list_id, task_id):
+        task = self.tasks.get(task_id)
+        return task if task is not None and task.list_id == list_id else None
+
+    async def get_task(self, list_id, task_id):
+        task = self._task(list_id, task_id)
+        return task.row() if task else None
+
+    async def rename_task(self, list_id, task_id, title):
+        task = self._task(list_id, task_id)
+        if task:
+            task.task = title
+        return task is not None
+
+    async def set_description(self, list_id, task_id, description):
+        task = self._task(list_id, task_id)
+        if task:
+            task.description = description
+        return task is not None
+
+    async def set_status(self, list_id, task_id, status):
+        task = self._task(list_id, task_id)
+        if not task:
+            return None
+
+        self._unindex(task)
+        task.status = status
+        self._index(task)
+        return task.row()
+
+    async def complete_task(self, list_id, task_id, now):
+        task = self._task(list_id, task_id)
+        if not task:
+            return None
+
+        self._unindex(task)
+        task.status = COMPLETED
+        task.completed_at = now
+        self._index(task)
+        return task.task
+
+    async def delete_task(self, list_id, task_id):
+        task = self._task(list_id, task_id)
+        if not task:
+            return None
+
+        self._release(task)
+        self._unindex(task)
+        del self.tasks[task_id]
+        del self.list_tasks[list_id][task_id]
+        self.deliveries.pop(task_id, None)
+        return task.task
+
+    async def active_page(self, list_id, limit, anchor_id=None, backward=False):
+        keys = self._active[list_id]
+        if anchor_id is None:
+            position = len(keys) if backward else 0
+        else:
+            anchor = self._task(list_id, anchor_id)
+            if not anchor or anchor.status >= COMPLETED:
+                return [], False
+            key = anchor.status, anchor.created_at, anchor_id
+            position = bisect.bisect_left(keys, key) if backward else bisect.bisect_right(keys, key)
+
+        page = keys[max(position - limit - 1, 0):position] if backward else keys[position:position + limit + 1]
+        has_more = len(page) > limit
+        page = page[len(page) - limit:] if backward and has_more else page[:limit]
+        return [self.tasks[task_id].list_row() for _, _, task_id in page], has_more
+
+    async def completed_page(self, list_id, limit, anchor_id=None, backward=False):
+        # Keys run oldest first; pages are shown newest first, so going forward
+        # reads back from the anchor and going back reads on from it.
+        keys = self._done[list_id]
+        if anchor_id is None:
+            position = 0 if backward else len(keys)
+        else:
+            anchor = self._done_task(list_id, anchor_id)
+            if not anchor:
+                return [], False
+            key = anchor.completed_at or 0, anchor_id
+            position = bisect.bisect_right(keys, key) if backward else bisect.bisect_left(keys, key)
+
+        if backward:
+            page = keys[position:position + limit + 1]
+            has_more = len(page) > limit
+            page = page[:limit][::-1]
+        else:
+            page = keys[max(position - limit - 1, 0):position][::-1]
+            has_more = len(page) > limit
+            page = page[:limit]
+        return [self._done_task(list_id, task_id).done_row() for _, task_id in page], has_more
+
+    async def search_tasks(self, list_id, terms, limit, offset):
+        # Prefix match on every term across title and description, like the FTS
+        # query; tasks matching more terms in the title rank first.
+        found = []
+        for task in self.list_tasks[list_id].values():
+            title, description = words(task.task), words(task.description)
+            in_title = [any(word.startswith(term) for word in title) for term in terms]
+            if all(hit or any(word.startswith(term) for word in description)
+                   for hit, term in zip(in_title, terms)):
+                found.append((-sum(in_title), task.task_id, task))
+
+        found.sort(key=lambda item: item[:2])
+        rows = [task.list_row() for _, _, task in found[offset:offset + limit + 1]]
+        return rows[:limit], len(rows) > limit
+
+    async def export_tasks(self, list_id, consume):
+        rows = [(task.task, task.description, task.status, task.created_at, task.completed_at, task.reminder_time)
+                for task in self.list_tasks[list_id].values()]
+        rows += [(task.task, task.description, COMPLETED, task.created_at, task.completed_at, None)
+                 for task in self.list_archive[list_id].values()]
+        return consume(rows)
+
+    async def list_stats(self, list_id):
+        tasks, archived = self.list_tasks[list_id].values(), self.list_archive[list_id].values()
+        if not tasks and not archived:
+            return None
+
+        counts = [0, 0, 0]
+        overdue = 0
+        for task in tasks:
+            counts[task.status] += 1
+            overdue += task.reminded == 1 and task.status != COMPLETED
+
+        done = [task for task in tasks if task.status == COMPLETED] + list(archived)
+        timed = [task for task in done if task.completed_at is not None and task.created_at is not None]
+        return (counts[STATUS_CODES["in_progress"]], counts[STATUS_CODES["not_started"]], counts[COMPLETED],
+                len(archived), overdue, len(timed), sum(task.completed_at - task.created_at for task in timed))
+
+    async def check_list_stats(self):
+        # Statistics are computed from the tasks on every request; there is
+        # nothing to drift.
+        return 0
+
+    async def archive_completed(self, before, limit):
+        end = min(bisect.bisect_left(self._completed, (before,)), limit)
+        tasks = [self.tasks[task_id] for _, task_id in self._completed[:end]]
+        for task in tasks:
+            self._release(task)
+            self._unindex(task)
+            del self.tasks[task.task_id]
+            del self.list_tasks[task.list_id][task.task_id]
+            self.deliveries.pop(task.task_id, None)
+            self.archive[task.task_id] = task
+            self.list_archive[task.list_id][task.task_id] = task
+            self._index(task)
+        return len(tasks)
+
+    async def compact_archive(self, before, limit):
+        end = min(bisect.bisect_left(self._compactable, (before,)), limit)
+        tasks = [self.archive[task_id] for _, task_id in self._compactable[:end]]
+        for task in tasks:
+            self._unindex(task)
+            task.description = None
+            self._index(task)
+        return len(tasks)
+
+    async def purge_archive(self, before, limit):
+        end = min(bisect.bisect_left(self._archived, (before,)), limit)
+        tasks = [self.archive[task_id] for _, task_id in self._archived[:end]]
+        for task in tasks:
+            self._unindex(task)
+            del self.archive[task.task_id]
+            del self.list_archive[task.list_id][task.task_id]
+        return len(tasks)
+
+    # reminders
+
+    async def pending_reminders(self, since=None):
+        start = bisect.bisect_left(self._pending, (since,)) if since is not None else 0
+        return [(task_id, reminder_time) for reminder_time, task_id in self._pending[start:]]
+
+    async def overdue_reminders(self, before, limit, after=None):
+        start = bisect.bisect_right(self._pending, after) if after is not None else 0
+        end = min(bisect.bisect_left(self._pending, (before,)), start + limit)
+        return [(task_id, reminder_time) for reminder_time, task_id in self._pending[start:end]]
+
+    async def count_overdue_reminders(self, before):
+        return bisect.bisect_left(self._pending, (before,))
+
+    async def set_reminder(self, list_id, task_id, reminder_time, rule=None):
+        task = self._task(list_id, task_id)
+        if not task:
+            return None
+
+        self._release(task)
+        self._unindex(task)
+        task.reminder_time = reminder_time
+        task.reminder_rule = rule
+        task.reminded = 0
+        self._index(task)
+        return task.task
+
+    def _release(self, task):
+        if task.reminder_owner is not None:
+            self.leases[task.reminder_owner].discard(task.task_id)
+        task.reminder_owner = None
+        task.reminder_lease = None
+
+    async def claim_reminder(self, task_id, now, worker, lease_until):
+        task = self.tasks.get(task_id)
+        if (not task or not task.reminder_pending() or task.reminder_time > now
+                or task.reminder_owner is not None and task.reminder_lease >= now):
+            return None
+
+        self._release(task)
+        task.reminder_owner = worker
+        task.reminder_lease = lease_until
+        self.leases[worker].add(task_id)
+
+        # Members that a crashed worker already reached are skipped on reclaim.
+        delivered = set(self.deliveries.get(task_id, {}).get(task.reminder_time, ()))
+        return task.list_id, task.task, task.reminder_time, task.reminder_rule, delivered
+
+    async def record_delivery(self, task_id, reminder_time, user_id, worker, lease_until):
+        self.deliveries.setdefault(task_id, {}).setdefault(reminder_time, set()).add(user_id)
+
+        task = self.tasks.get(task_id)
+        if not task or task.reminder_owner != worker:
+            return False
+        task.reminder_lease = lease_until
+        return True
+
+    async def finish_reminder(self, task_id, worker, next_time=None):
+        task = self.tasks.get(task_id)
+        if not task or task.reminder_owner != worker:
+            return False
+
+        self.deliveries.pop(task_id, None)
+        self._release(task)
+        self._unindex(task)
+        if next_time is None:
+            task.reminded = 1
+        else:
+            task.reminder_time = next_time
+            task.reminded = 0
+        self._index(task)
+        return True
+
+    async def renew_reminder_leases(self, worker, lease_until):
+        for task_id in self.leases[worker]:
+            self.tasks[task_id].reminder_lease = lease_until
+
+    async def release_reminder_leases(self, worker):
+        task_ids = self.leases.pop(worker, set())
+        for task_id in task_ids:
+            task = self.tasks[task_id]
+            task.reminder_owner = None
+            task.reminder_lease = None
+        return len(task_ids)
+
+    async def claimable_reminders(self, now, horizon, since=None):
+        start = bisect.bisect_left(self._pending, (since,)) if since is not None else 0
+        claimable = []
+        for reminder_time, task_id in self._pending[start:]:
+            if reminder_time > now + horizon:
+                break
+            task = self.tasks[task_id]
+            if task.reminder_owner is None or task.reminder_lease < now:
+                claimable.append((task_id, reminder_time))
+        return claimable
+
+    # lifecycle
+
+    def fsm_storage(self):
+        return MemoryStorage()
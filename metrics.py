@@ -0,0 +1,224 @@
+import asyncio
+import bisect
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(name, label_names, label_values, value, extra=()):
+    pairs = [f'{key}="{_escape(val)}"' for key, val in (*zip(label_names, label_values), *extra)]
+    labels = "{" + ",".join(pairs) + "}" if pairs else ""
+    return f"{name}{labels} {value:g}" if isinstance(value, float) else f"{name}{labels} {value}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # collect() is read at scrape time: a number, or {label values: number}.
+        self.collect = collect
+        self.values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _collected(self):
+        if self.collect is None:
+            with self._lock:
+                return dict(self.values)
+        value = self.collect()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for label_values, value in sorted(self._collected().items()):
+            lines.append(_format(self.name, self.labels, label_values, value))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] += amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self.series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(_format(f"{self.name}_bucket", self.labels, labels, cumulative,
+                                     (("le", f"{bound:g}" if bound != "+Inf" else bound),)))
+            lines.append(_format(f"{self.name}_sum", self.labels, labels, total))
+            lines.append(_format(f"{self.name}_count", self.labels, labels, cumulative))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), collect=None):
+        return self._add(Counter(name, help, labels, collect))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._add(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning("metric %s failed to collect: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+class HandlerMetrics(BaseMiddleware):
+    def __init__(self, registry, handler_name=None):
+        # handler_name(event, data) can name the real handler behind a generic
+        # one, e.g. the callback route dispatching on decoded button data.
+        self.handler_name = handler_name
+        self.latency = registry.histogram("bot_handler_seconds", "Handler latency.", ("handler",))
+        self.errors = registry.counter("bot_handler_errors_total", "Handler exceptions.", ("handler",))
+
+    async def __call__(self, handler, event, data):
+        name = (self.handler_name and self.handler_name(event, data)) or data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(name)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started, name)
+
+
+class QueryMetrics:
+    def __init__(self, registry):
+        self.latency = registry.histogram("bot_db_query_seconds", "Time spent running SQLite calls.",
+                                          ("kind", "query"))
+        self.wait = registry.histogram("bot_db_queue_seconds", "Time SQLite calls waited for a connection.",
+                                       ("kind",))
+        self.batch = registry.histogram("bot_db_commit_batch_size", "Writes group-committed per transaction.",
+                                        buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+        self.commit_latency = registry.histogram("bot_db_commit_seconds", "Time spent on a write batch.")
+
+    def __call__(self, kind, query, waited, elapsed):
+        self.wait.observe(waited, kind)
+        self.latency.observe(elapsed, kind, query)
+
+    def commit(self, size, elapsed):
+        self.batch.observe(size)
+        self.commit_latency.observe(elapsed)
+
+
+class LoopWatchdog:
+    def __init__(self, registry, threshold=0.25, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = registry.histogram("bot_event_loop_lag_seconds", "Event loop scheduling delay.",
+                                      buckets=LATENCY_BUCKETS)
+        self.blocked = registry.counter("bot_event_loop_blocked_total",
+                                        "Times the event loop was blocked for longer than the threshold.")
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._stopped = threading.Event()
+        self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            self.lag.observe(max(self._beat - started - self.interval, 0.0))
+
+    def _watch(self):
+        # Runs in its own thread so it can look at the loop while the loop is stuck,
+        # and report the stack of whatever callback is holding it.
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold or reported == beat:
+                continue
+            reported = beat
+            self.blocked.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.warning("event loop blocked for %.3fs:\n%s", stalled, stack)
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+
+async def serve(registry, host="127.0.0.1", port=9090):
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,376 @@
+import os
+import sqlite3
+
+MIGRATIONS = [
+    # 1: the original schema, kept idempotent so databases created before
+    # versioning was introduced pass through it unchanged.
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        list_id TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS task_lists (
+        list_id TEXT PRIMARY KEY
+    );
+
+    CREATE TABLE IF NOT EXISTS tasks (
+        task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        list_id TEXT,
+        task TEXT,
+        description TEXT,
+        status TEXT,
+        created_at TEXT,
+        reminder_time TEXT,
+        reminded INTEGER DEFAULT 0,
+        completed_at TEXT,
+        FOREIGN KEY (list_id) REFERENCES task_lists(list_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS list_members (
+        list_id TEXT,
+        user_id TEXT,
+        PRIMARY KEY (list_id, user_id),
+        FOREIGN KEY (list_id) REFERENCES task_lists(list_id),
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    );
+    ''',
+
+    # 2: status as an integer enum ordered the way the active list sorts
+    # (0 in progress, 1 not started, 2 completed), timestamps as epoch
+    # seconds, and indexes for the list, history and reminder queries.
+    '''
+    CREATE TABLE tasks_new (
+        task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        list_id TEXT,
+        task TEXT,
+        description TEXT,
+        status INTEGER NOT NULL DEFAULT 1,
+        created_at INTEGER,
+        reminder_time INTEGER,
+        reminded INTEGER DEFAULT 0,
+        completed_at INTEGER,
+        FOREIGN KEY (list_id) REFERENCES task_lists(list_id)
+    );
+
+    INSERT INTO tasks_new (task_id, list_id, task, description, status, created_at,
+                           reminder_time, reminded, completed_at)
+    SELECT task_id, list_id, task, description,
+           CASE status WHEN 'В процессе' THEN 0 WHEN 'Выполнена' THEN 2 ELSE 1 END,
+           CAST(strftime('%s', created_at, 'utc') AS INTEGER),
+           CAST(strftime('%s', reminder_time, 'utc') AS INTEGER),
+           reminded,
+           CAST(strftime('%s', completed_at, 'utc') AS INTEGER)
+    FROM tasks;
+
+    DROP TABLE tasks;
+    ALTER TABLE tasks_new RENAME TO tasks;
+
+    CREATE INDEX idx_tasks_active ON tasks (list_id, status, created_at, task_id);
+    CREATE INDEX idx_tasks_completed ON tasks (list_id, status, completed_at, task_id);
+    CREATE INDEX idx_tasks_pending_reminders ON tasks (reminder_time)
+        WHERE reminded = 0 AND reminder_time IS NOT NULL;
+    ''',
+
+    # 3: persistent FSM storage
+    '''
+    CREATE TABLE fsm_state (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at INTEGER
+    );
+
+    CREATE INDEX idx_fsm_state_updated ON fsm_state (updated_at);
+    ''',
+
+    # 4: lease-based reminder claiming shared by several worker processes
+    '''
+    ALTER TABLE tasks ADD COLUMN reminder_owner TEXT;
+    ALTER TABLE tasks ADD COLUMN reminder_lease INTEGER;
+
+    CREATE TABLE reminder_deliveries (
+        task_id INTEGER,
+        reminder_time INTEGER,
+        user_id TEXT,
+        PRIMARY KEY (task_id, reminder_time, user_id)
+    );
+
+    CREATE INDEX idx_tasks_reminder_owner ON tasks (reminder_owner) WHERE reminder_owner IS NOT NULL;
+    ''',
+
+    # 5: archive tier for old completed tasks; task_id keeps the original id so
+    # history pages can seek across both tables with the same keyset.
+    '''
+    CREATE TABLE tasks_archive (
+        task_id INTEGER PRIMARY KEY,
+        list_id TEXT,
+        task TEXT,
+        description TEXT,
+        created_at INTEGER,
+        completed_at INTEGER
+    );
+
+    CREATE INDEX idx_tasks_archive_list ON tasks_archive (list_id, completed_at, task_id);
+    CREATE INDEX idx_tasks_archive_completed ON tasks_archive (completed_at);
+    CREATE INDEX idx_tasks_completed_at ON tasks (completed_at) WHERE status = 2;
+    ''',
+
+    # 6: full-text search over task titles and descriptions. The index is an
+    # external-content FTS5 table kept in sync by triggers; list_id is indexed
+    # too so a search can be scoped to one list inside the MATCH itself.
+    '''
+    CREATE VIRTUAL TABLE tasks_fts USING fts5(
+        list_id, task, description,
+        content = 'tasks', content_rowid = 'task_id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+
+    INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+
+    CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, list_id, task, description)
+        VALUES (new.task_id, new.list_id, new.task, new.description);
+    END;
+
+    CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, list_id, task, description)
+        VALUES ('delete', old.task_id, old.list_id, old.task, old.description);
+    END;
+
+    CREATE TRIGGER tasks_fts_update AFTER UPDATE OF list_id, task, description ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, list_id, task, description)
+        VALUES ('delete', old.task_id, old.list_id, old.task, old.description);
+        INSERT INTO tasks_fts (rowid, list_id, task, description)
+        VALUES (new.task_id, new.list_id, new.task, new.description);
+    END;
+    ''',
+
+    # 7: invite tokens for shared lists
+    '''
+    CREATE TABLE list_invites (
+        token TEXT PRIMARY KEY,
+        list_id TEXT NOT NULL,
+        created_by TEXT,
+        expires_at INTEGER NOT NULL
+    );
+
+    CREATE INDEX idx_list_invites_expires ON list_invites (expires_at);
+    ''',
+
+    # 8: recurrence rule; a recurring reminder keeps a single row whose
+    # reminder_time is moved forward after each firing
+    '''
+    ALTER TABLE tasks ADD COLUMN reminder_rule TEXT;
+    ''',
+
+    # 9: opt-in daily summary; summary_at is the next time it is due
+    '''
+    ALTER TABLE users ADD COLUMN summary_at INTEGER;
+
+    CREATE INDEX idx_users_summary ON users (summary_at) WHERE summary_at IS NOT NULL;
+    ''',
+
+    # 10: per-list aggregates kept current by triggers. completed counts done
+    # tasks still in tasks, archived the ones moved to tasks_archive; done_count
+    # and done_seconds (sum of completed_at - created_at) cover both, so the
+    # average survives archiving. overdue is fired but not completed. The
+    # triggers avoid INSERT OR IGNORE: an outer INSERT OR REPLACE (archiving)
+    # would override it and reset the row.
+    '''
+    CREATE TABLE list_stats (
+        list_id TEXT PRIMARY KEY,
+        in_progress INTEGER NOT NULL DEFAULT 0,
+        not_started INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        archived INTEGER NOT NULL DEFAULT 0,
+        overdue INTEGER NOT NULL DEFAULT 0,
+        done_count INTEGER NOT NULL DEFAULT 0,
+        done_seconds INTEGER NOT NULL DEFAULT 0
+    );
+
+    INSERT INTO list_stats 
+    SELECT list_id, SUM(status = 0), SUM(status = 1), SUM(status = 2 AND NOT archived), SUM(archived), 
+           SUM(reminded = 1 AND status != 2), 
+           SUM(status = 2 AND completed_at IS NOT NULL AND created_at IS NOT NULL), 
+           SUM(CASE WHEN status = 2 THEN IFNULL(completed_at - created_at, 0) ELSE 0 END) 
+    FROM (
+        SELECT list_id, status, reminded, created_at, completed_at, 0 AS archived FROM tasks 
+        UNION ALL 
+        SELECT list_id, 2, 0, created_at, completed_at, 1 FROM tasks_archive
+    ) 
+    WHERE list_id IS NOT NULL 
+    GROUP BY list_id;
+
+    CREATE TRIGGER list_stats_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO list_stats (list_id) SELECT new.list_id 
+        WHERE NOT EXISTS (SELECT 1 FROM list_stats WHERE list_id = new.list_id);
+        UPDATE list_stats SET 
+            in_progress = in_progress + (new.status = 0), 
+            not_started = not_started + (new.status = 1), 
+            completed = completed + (new.status = 2), 
+            overdue = overdue + (new.reminded = 1 AND new.status != 2), 
+            done_count = done_count + (new.status = 2 AND new.completed_at IS NOT NULL AND new.created_at IS NOT NULL), 
+            done_seconds = done_seconds + CASE WHEN new.status = 2 THEN IFNULL(new.completed_at - new.created_at, 0) ELSE 0 END 
+        WHERE list_id = new.list_id;
+    END;
+
+    CREATE TRIGGER list_stats_delete AFTER DELETE ON tasks BEGIN
+        UPDATE list_stats SET 
+            in_progress = in_progress - (old.status = 0), 
+            not_started = not_started - (old.status = 1), 
+            completed = completed - (old.status = 2), 
+            overdue = overdue - (old.reminded = 1 AND old.status != 2), 
+            done_count = done_count - (old.status = 2 AND old.completed_at IS NOT NULL AND old.created_at IS NOT NULL), 
+            done_seconds = done_seconds - CASE WHEN old.status = 2 THEN IFNULL(old.completed_at - old.created_at, 0) ELSE 0 END 
+        WHERE list_id = old.list_id;
+    END;
+
+    CREATE TRIGGER list_stats_update AFTER UPDATE OF list_id, status, reminded, created_at, completed_at ON tasks 
+    WHEN old.list_id IS NOT new.list_id OR old.status IS NOT new.status OR old.reminded IS NOT new.reminded 
+      OR old.created_at IS NOT new.created_at OR old.completed_at IS NOT new.completed_at 
+    BEGIN
+        UPDATE list_stats SET 
+            in_progress = in_progress - (old.status = 0), 
+            not_started = not_started - (old.status = 1), 
+            completed = completed - (old.status = 2), 
+            overdue = overdue - (old.reminded = 1 AND old.status != 2), 
+            done_count = done_count - (old.status = 2 AND old.completed_at IS NOT NULL AND old.created_at IS NOT NULL), 
+            done_seconds = done_seconds - CASE WHEN old.status = 2 THEN IFNULL(old.completed_at - old.created_at, 0) ELSE 0 END 
+        WHERE list_id = old.list_id;
+        INSERT INTO list_stats (list_id) SELECT new.list_id 
+        WHERE NOT EXISTS (SELECT 1 FROM list_stats WHERE list_id = new.list_id);
+        UPDATE list_stats SET 
+            in_progress = in_progress + (new.status = 0), 
+            not_started = not_started + (new.status = 1), 
+            completed = completed + (new.status = 2), 
+            overdue = overdue + (new.reminded = 1 AND new.status != 2), 
+            done_count = done_count + (new.status = 2 AND new.completed_at IS NOT NULL AND new.created_at IS NOT NULL), 
+            done_seconds = done_seconds + CASE WHEN new.status = 2 THEN IFNULL(new.completed_at - new.created_at, 0) ELSE 0 END 
+        WHERE list_id = new.list_id;
+    END;
+
+    CREATE TRIGGER list_stats_archive AFTER INSERT ON tasks_archive BEGIN
+        INSERT INTO list_stats (list_id) SELECT new.list_id 
+        WHERE NOT EXISTS (SELECT 1 FROM list_stats WHERE list_id = new.list_id);
+        UPDATE list_stats SET 
+            archived = archived + 1, 
+            done_count = done_count + (new.completed_at IS NOT NULL AND new.created_at IS NOT NULL), 
+            done_seconds = done_seconds + IFNULL(new.completed_at - new.created_at, 0) 
+        WHERE list_id = new.list_id;
+    END;
+
+    CREATE TRIGGER list_stats_purge AFTER DELETE ON tasks_archive BEGIN
+        UPDATE list_stats SET 
+            archived = archived - 1, 
+            done_count = done_count - (old.completed_at IS NOT NULL AND old.created_at IS NOT NULL), 
+            done_seconds = done_seconds - IFNULL(old.completed_at - old.created_at, 0) 
+        WHERE list_id = old.list_id;
+    END;
+    ''',
+
+    # 11: search treats ё as е. unicode61 leaves ё alone, so the index is built
+    # from a view with it folded, and the triggers fold the same way.
+    '''
+    DROP TRIGGER tasks_fts_insert;
+    DROP TRIGGER tasks_fts_delete;
+    DROP TRIGGER tasks_fts_update;
+    DROP TABLE tasks_fts;
+
+    CREATE VIEW tasks_search AS 
+    SELECT task_id, list_id, 
+           replace(replace(task, 'ё', 'е'), 'Ё', 'Е') AS task, 
+           replace(replace(description, 'ё', 'е'), 'Ё', 'Е') AS description 
+    FROM tasks;
+
+    CREATE VIRTUAL TABLE tasks_fts USING fts5(
+        list_id, task, description,
+        content = 'tasks_search', content_rowid = 'task_id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+
+    INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+
+    CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, list_id, task, description)
+        SELECT task_id, list_id, task, description FROM tasks_search WHERE task_id = new.task_id;
+    END;
+
+    CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, list_id, task, description)
+        VALUES ('delete', old.task_id, old.list_id,
+                replace(replace(old.task, 'ё', 'е'), 'Ё', 'Е'),
+                replace(replace(old.description, 'ё', 'е'), 'Ё', 'Е'));
+    END;
+
+    CREATE TRIGGER tasks_fts_update AFTER UPDATE OF list_id, task, description ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, list_id, task, description)
+        VALUES ('delete', old.task_id, old.list_id,
+                replace(replace(old.task, 'ё', 'е'), 'Ё', 'Е'),
+                replace(replace(old.description, 'ё', 'е'), 'Ё', 'Е'));
+        INSERT INTO tasks_fts (rowid, list_id, task, description)
+        SELECT task_id, list_id, task, description FROM tasks_search WHERE task_id = new.task_id;
+    END;
+    ''',
+
+    # 12: the personal list a user left behind by joining a shared one, given
+    # back to them on /leave
+    '''
+    ALTER TABLE users ADD COLUMN home_list_id TEXT;
+    ''',
+]
+
+
+def split_statements(script):
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        # Trigger bodies contain semicolons; a statement ends only once SQLite
+        # considers it complete.
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+    if statement.strip():
+        yield statement
+
+
+def migrate(conn):
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+        return len(MIGRATIONS)
+
+    # Several processes may start on one database at once. Each step takes the
+    # write lock first and re-reads the version under it, so a step another
+    # process has just applied is skipped instead of run twice. executescript()
+    # would commit the open transaction, hence statement by statement.
+    conn.isolation_level = None
+    for target, script in enumerate(MIGRATIONS, 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < target:
+                for statement in split_statements(script):
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {target}')
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    return len(MIGRATIONS)
+
+
+_checked = set()
+
+
+def ensure_schema(path):
+    # Only the first call per database in a process opens a connection; with an
+    # up-to-date schema that costs a single PRAGMA read.
+    path = os.path.abspath(path)
+    if path in _checked:
+        return
+    conn = sqlite3.connect(path)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+    _checked.add(path)
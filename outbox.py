@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+INTERACTIVE = 0
+BULK = 1
+BACKLOG = 2
+
+send_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now, cost=1):
+        self._refill(now)
+        return 0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, now, cost=1):
+        self._refill(now)
+        self.tokens -= cost
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundItem:
+    def __init__(self, priority, chat_id, make_request, bot, method, future):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.future = future
+        self.attempts = 0
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, concurrency=8, max_retries=5):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._blocked = {}
+        self._ready = []
+        self._waiting = []
+        self._seq = itertools.count()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._pump = None
+        self._in_flight = set()
+
+    def __len__(self):
+        return len(self._ready) + len(self._waiting) + len(self._in_flight)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        # Only chat-bound calls count against Telegram's send limits; callback
+        # answers, getMe and friends go straight through.
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._push(OutboundItem(send_priority.get(), chat_id, make_request, bot, method, future))
+        return await future
+
+    def _push(self, item, ready_at=None):
+        if ready_at is None:
+            heapq.heappush(self._ready, (item.priority, next(self._seq), item))
+        else:
+            heapq.heappush(self._waiting, (ready_at, item.priority, next(self._seq), item))
+        self._wakeup.set()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _chat_delay(self, chat_id, now):
+        blocked = self._blocked.get(chat_id, 0) - now
+        if blocked > 0:
+            return blocked
+        self._blocked.pop(chat_id, None)
+        return self._chat_bucket(chat_id).delay(now)
+
+    def _release_waiting(self, now):
+        while self._waiting and self._waiting[0][0] <= now:
+            _, priority, seq, item = heapq.heappop(self._waiting)
+            heapq.heappush(self._ready, (priority, seq, item))
+
+    def _prune_chats(self, now):
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.full(now)]:
+            del self._chats[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._release_waiting(now)
+
+            if not self._ready:
+                if len(self._chats) > 10000:
+                    self._prune_chats(now)
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self._global.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, item = heapq.heappop(self._ready)
+            if item.future.done():
+                continue
+
+            delay = self._chat_delay(item.chat_id, now)
+            if delay:
+                self._push(item, now + delay)
+                continue
+
+            await self._slots.acquire()
+            now = time.monotonic()
+            self._global.take(now)
+            self._chat_bucket(item.chat_id).take(now)
+
+            task = asyncio.create_task(self._send(item))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, item):
+        try:
+            result = await item.make_request(item.bot, item.method)
+        except TelegramRetryAfter as e:
+            item.attempts += 1
+            if item.attempts > self.max_retries:
+                self._resolve(item, exception=e)
+            else:
+                ready_at = time.monotonic() + e.retry_after
+                self._blocked[item.chat_id] = ready_at
+                self._push(item, ready_at)
+        except Exception as e:
+            self._resolve(item, exception=e)
+        else:
+            self._resolve(item, result=result)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _resolve(item, result=None, exception=None):
+        if item.future.done():
+            return
+        if exception is not None:
+            item.future.set_exception(exception)
+        else:
+            item.future.set_result(result)
+
+    async def drain(self):
+        while len(self):
+            await asyncio.sleep(0.05)
@@ -0,0 +1,70 @@
+import math
+import re
+from datetime import datetime, timedelta
+
+DAY = 86400
+
+RULE_LABELS = {
+    "daily": "ежедневно",
+    "weekly": "еженедельно",
+    "weekdays": "по будням",
+}
+
+_ALIASES = {
+    "ежедневно": "daily",
+    "каждый день": "daily",
+    "daily": "daily",
+    "еженедельно": "weekly",
+    "каждую неделю": "weekly",
+    "weekly": "weekly",
+    "по будням": "weekdays",
+    "будни": "weekdays",
+    "weekdays": "weekdays",
+}
+
+_HOURS = re.compile(r"^(?:каждые|every)\s+(\d+)\s*(?:ч|час|часа|часов|h|hours?)$")
+
+
+def parse_rule(text):
+    text = " ".join(text.lower().split())
+    if not text:
+        return None
+    if text in _ALIASES:
+        return _ALIASES[text]
+
+    match = _HOURS.match(text)
+    if match and 1 <= int(match.group(1)) <= 24 * 7:
+        return f"hours:{int(match.group(1))}"
+    raise ValueError(f"unknown recurrence rule: {text}")
+
+
+def describe_rule(rule):
+    if rule and rule.startswith("hours:"):
+        return f"каждые {rule[6:]} ч"
+    return RULE_LABELS.get(rule, "")
+
+
+def _shift_days(due, days):
+    # Calendar arithmetic on local wall-clock time, so a 09:00 reminder stays at
+    # 09:00 across DST changes.
+    return int((datetime.fromtimestamp(due) + timedelta(days=days)).timestamp())
+
+
+def next_occurrence(rule, due, now):
+    # Jumps straight to the first occurrence after `now` instead of stepping
+    # through every missed one, so a long outage still costs O(1).
+    if rule.startswith("hours:"):
+        period = int(rule[6:]) * 3600
+        return due + (max(now - due, 0) // period + 1) * period
+
+    step = 7 if rule == "weekly" else 1
+    steps = max(math.ceil((now - due) / (step * DAY)), 1) if now > due else 1
+    candidate = _shift_days(due, steps * step)
+    while candidate <= now:
+        candidate = _shift_days(candidate, step)
+
+    if rule == "weekdays":
+        weekday = datetime.fromtimestamp(candidate).weekday()
+        if weekday >= 5:
+            candidate = _shift_days(candidate, 7 - weekday)
+    return candidate
@@ -0,0 +1,203 @@
+from abc import ABC, abstractmethod
+
+STATUS_CODES = {
+    "in_progress": 0,
+    "not_started": 1,
+    "completed": 2
+}
+
+
+class TaskRepository(ABC):
+    # Everything the bot stores goes through these calls; handlers never see
+    # SQL or connections. Task rows come back as plain tuples:
+    #   task:      (task, description, status, reminder_time, reminded, reminder_rule)
+    #   list row:  (task_id, task, status, reminder_time, reminded)
+    #   done row:  (task_id, task, description, completed_at)
+
+    # users, lists and members
+
+    @abstractmethod
+    async def user_list(self, user_id):
+        ...
+
+    @abstractmethod
+    async def list_members(self, list_id):
+        ...
+
+    @abstractmethod
+    async def create_user_list(self, user_id):
+        ...
+
+    @abstractmethod
+    async def create_invite(self, list_id, user_id, now, ttl):
+        ...
+
+    @abstractmethod
+    async def join_list(self, user_id, token, now):
+        # (list_id, old_list_id), or None for an unknown or expired token. A
+        # list nobody else is in is kept as the user's home list.
+        ...
+
+    @abstractmethod
+    async def leave_list(self, user_id):
+        # (old_list_id, new_list_id, restored), or None if the user's list isn't
+        # shared. The user goes back to their home list if they have one
+        # (restored is True), otherwise to a new empty list.
+        ...
+
+    @abstractmethod
+    async def summary_time(self, user_id):
+        ...
+
+    @abstractmethod
+    async def set_summary_time(self, user_id, summary_at):
+        ...
+
+    @abstractmethod
+    async def claim_summaries(self, now, day_end, next_time):
+        # Due summaries as [(user_id, [(task, reminder_time, reminded), ...])]
+        # for today's and overdue reminders; every claimed user's summary_at is
+        # moved to next_time(summary_at) in the same step.
+        ...
+
+    # tasks
+
+    @abstractmethod
+    async def add_task(self, list_id, title, description, status, created_at):
+        ...
+
+    @abstractmethod
+    async def add_tasks(self, list_id, tasks, now):
+        # tasks: [(title, description, status)]
+        ...
+
+    @abstractmethod
+    async def get_task(self, list_id, task_id):
+        ...
+
+    @abstractmethod
+    async def rename_task(self, list_id, task_id, title):
+        ...
+
+    @abstractmethod
+    async def set_description(self, list_id, task_id, description):
+        ...
+
+    @abstractmethod
+    async def set_status(self, list_id, task_id, status):
+        # The updated task, or None if it isn't in the list.
+        ...
+
+    @abstractmethod
+    async def complete_task(self, list_id, task_id, now):
+        # The task's title, or None if it isn't in the list.
+        ...
+
+    @abstractmethod
+    async def delete_task(self, list_id, task_id):
+        ...
+
+    @abstractmethod
+    async def active_page(self, list_id, limit, anchor_id=None, backward=False):
+        # Open tasks ordered by (status, created_at, task_id), paged by keyset
+        # from anchor_id: ([list row], has_more).
+        ...
+
+    @abstractmethod
+    async def completed_page(self, list_id, limit, anchor_id=None, backward=False):
+        # Completed and archived tasks, newest first: ([done row], has_more).
+        ...
+
+    @abstractmethod
+    async def search_tasks(self, list_id, terms, limit, offset):
+        # Tasks whose title or description has a word starting with every term,
+        # title matches ranked first: ([list row], has_more).
+        ...
+
+    @abstractmethod
+    async def export_tasks(self, list_id, consume):
+        # Calls consume(rows), possibly in a worker thread, with an iterable of
+        # (task, description, status, created_at, completed_at, reminder_time)
+        # over the list and its archive, and returns what consume returns.
+        ...
+
+    @abstractmethod
+    async def list_stats(self, list_id):
+        # (in_progress, not_started, completed, archived, overdue, done_count,
+        # done_seconds) or None.
+        ...
+
+    @abstractmethod
+    async def check_list_stats(self):
+        # Rebuilds the aggregates if they drifted; returns how many rows did.
+        ...
+
+    @abstractmethod
+    async def archive_completed(self, before, limit):
+        ...
+
+    @abstractmethod
+    async def compact_archive(self, before, limit):
+        ...
+
+    @abstractmethod
+    async def purge_archive(self, before, limit):
+        ...
+
+    # reminders
+
+    @abstractmethod
+    async def pending_reminders(self, since=None):
+        # [(task_id, reminder_time)], only those due at or after `since` if given.
+        ...
+
+    @abstractmethod
+    async def overdue_reminders(self, before, limit, after=None):
+        # Pending reminders due before `before`, ordered by (reminder_time,
+        # task_id) and continuing past `after`, one such pair.
+        ...
+
+    @abstractmethod
+    async def count_overdue_reminders(self, before):
+        ...
+
+    @abstractmethod
+    async def set_reminder(self, list_id, task_id, reminder_time, rule=None):
+        # The task's title, or None if it isn't in the list.
+        ...
+
+    @abstractmethod
+    async def claim_reminder(self, task_id, now, worker, lease_until):
+        # (list_id, task, reminder_time, rule, delivered user ids), or None if
+        # the reminder isn't due or another worker holds it.
+        ...
+
+    @abstractmethod
+    async def record_delivery(self, task_id, reminder_time, user_id, worker, lease_until):
+        # False once the worker has lost the lease.
+        ...
+
+    @abstractmethod
+    async def finish_reminder(self, task_id, worker, next_time=None):
+        ...
+
+    @abstractmethod
+    async def renew_reminder_leases(self, worker, lease_until):
+        ...
+
+    @abstractmethod
+    async def release_reminder_leases(self, worker):
+        ...
+
+    @abstractmethod
+    async def claimable_reminders(self, now, horizon, since=None):
+        ...
+
+    # lifecycle
+
+    @abstractmethod
+    def fsm_storage(self):
+        ...
+
+    async def close(self):
+        pass
@@ -0,0 +1,73 @@
+import asyncio
+import heapq
+import time
+
+
+class ReminderScheduler:
+    def __init__(self, fire):
+        self.fire = fire
+        self._heap = []
+        self._due = {}
+        self._wakeup = asyncio.Event()
+        self._running = set()
+
+    def __len__(self):
+        return len(self._due)
+
+    @property
+    def in_flight(self):
+        return len(self._running)
+
+    def overdue(self, now):
+        return sum(1 for due in self._due.values() if due <= now)
+
+    def load(self, reminders):
+        self._due = dict(reminders)
+        self._heap = [(due, task_id) for task_id, due in self._due.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, task_id, due):
+        if self._due.get(task_id) == due:
+            return
+        self._due[task_id] = due
+        heapq.heappush(self._heap, (due, task_id))
+        if self._heap[0] == (due, task_id):
+            self._wakeup.set()
+
+    def cancel(self, task_id):
+        # Heap entries are removed lazily: anything that no longer matches
+        # self._due is skipped when it reaches the top.
+        if self._due.pop(task_id, None) is not None and len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(due, task_id) for task_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now):
+        fired = []
+        while self._heap and self._heap[0][0] <= now:
+            due, task_id = heapq.heappop(self._heap)
+            if self._due.get(task_id) == due:
+                del self._due[task_id]
+                fired.append((task_id, due))
+        return fired
+
+    def _start(self, task_id, due):
+        task = asyncio.create_task(self.fire(task_id, due))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def drain(self, timeout=None):
+        if self._running:
+            await asyncio.wait(self._running, timeout=timeout)
+
+    async def run(self):
+        while True:
+            for task_id, due in self._pop_due(time.time()):
+                self._start(task_id, due)
+
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
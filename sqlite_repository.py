@@ -0,0 +1,676 @@
+import secrets
+import uuid
+from itertools import groupby
+
+from db import Database
+from migrations import ensure_schema
+from repository import STATUS_CODES, TaskRepository
+from storage import SQLiteStorage
+
+COMPLETED = STATUS_CODES["completed"]
+
+
+def fetch_user_list(conn, user_id):
+    row = conn.execute('SELECT list_id FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def fetch_list_members(conn, list_id):
+    rows = conn.execute('SELECT user_id FROM list_members WHERE list_id = ?', (list_id,))
+    return tuple(user_id for (user_id,) in rows)
+
+
+def fetch_summary_time(conn, user_id):
+    row = conn.execute('SELECT summary_at FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def insert_task(conn, list_id, title, description, status, created_at):
+    return conn.execute('''
+    INSERT INTO tasks (list_id, task, description, status, created_at, reminder_time, reminded)
+    VALUES (?, ?, ?, ?, ?, NULL, 0)
+    ''', (list_id, title, description, status, created_at)).lastrowid
+
+
+def rename_task(conn, list_id, task_id, title):
+    return conn.execute('''
+    UPDATE tasks 
+    SET task = ? 
+    WHERE task_id = ? AND list_id = ?
+    ''', (title, task_id, list_id)).rowcount > 0
+
+
+def update_description(conn, list_id, task_id, description):
+    return conn.execute('''
+    UPDATE tasks 
+    SET description = ? 
+    WHERE task_id = ? AND list_id = ?
+    ''', (description, task_id, list_id)).rowcount > 0
+
+
+def fetch_list_stats(conn, list_id):
+    return conn.execute('''
+    SELECT in_progress, not_started, completed, archived, overdue, done_count, done_seconds 
+    FROM list_stats 
+    WHERE list_id = ?
+    ''', (list_id,)).fetchone()
+
+
+def create_user_list(conn, user_id):
+    if conn.execute('SELECT list_id FROM users WHERE user_id = ?', (user_id,)).fetchone():
+        return
+
+    list_id = str(uuid.uuid4())
+
+    conn.execute('INSERT INTO task_lists (list_id) VALUES (?)', (list_id,))
+    conn.execute('INSERT INTO users (user_id, list_id) VALUES (?, ?)', (user_id, list_id))
+    conn.execute('INSERT INTO list_members (list_id, user_id) VALUES (?, ?)', (list_id, user_id))
+
+
+def create_invite(conn, list_id, user_id, now, ttl):
+    conn.execute('DELETE FROM list_invites WHERE expires_at <= ?', (now,))
+
+    token = secrets.token_urlsafe(12)
+    conn.execute('''
+    INSERT INTO list_invites (token, list_id, created_by, expires_at) VALUES (?, ?, ?, ?)
+    ''', (token, list_id, user_id, now + ttl))
+
+    return token
+
+
+def join_list(conn, user_id, token, now):
+    invite = conn.execute('SELECT list_id FROM list_invites WHERE token = ? AND expires_at > ?',
+                          (token, now)).fetchone()
+    if not invite:
+        return None
+
+    list_id = invite[0]
+    user = conn.execute('SELECT list_id, home_list_id FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    old_list_id = user[0] if user else None
+    if old_list_id == list_id:
+        return list_id, old_list_id
+
+    if user:
+        # A list only this user is in would become unreachable; it is kept as
+        # their home list and given back on /leave.
+        others = conn.execute('SELECT 1 FROM list_members WHERE list_id = ? AND user_id != ? LIMIT 1',
+                              (old_list_id, user_id)).fetchone()
+        home_list_id = user[1] if others else old_list_id
+        if home_list_id == list_id:
+            home_list_id = None
+        conn.execute('UPDATE users SET list_id = ?, home_list_id = ? WHERE user_id = ?',
+                     (list_id, home_list_id, user_id))
+        conn.execute('DELETE FROM list_members WHERE list_id = ? AND user_id = ?', (old_list_id, user_id))
+    else:
+        conn.execute('INSERT INTO users (user_id, list_id) VALUES (?, ?)', (user_id, list_id))
+    conn.execute('INSERT OR IGNORE INTO list_members (list_id, user_id) VALUES (?, ?)', (list_id, user_id))
+
+    return list_id, old_list_id
+
+
+def leave_list(conn, user_id):
+    user = conn.execute('SELECT list_id, home_list_id FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    if not user:
+        return None
+
+    old_list_id, list_id = user
+    others = conn.execute('SELECT 1 FROM list_members WHERE list_id = ? AND user_id != ? LIMIT 1',
+                          (old_list_id, user_id)).fetchone()
+    if not others:
+        return None
+
+    restored = list_id is not None
+    if not restored:
+        list_id = str(uuid.uuid4())
+        conn.execute('INSERT INTO task_lists (list_id) VALUES (?)', (list_id,))
+    conn.execute('UPDATE users SET list_id = ?, home_list_id = NULL WHERE user_id = ?', (list_id, user_id))
+    conn.execute('DELETE FROM list_members WHERE list_id = ? AND user_id = ?', (old_list_id, user_id))
+    conn.execute('INSERT OR IGNORE INTO list_members (list_id, user_id) VALUES (?, ?)', (list_id, user_id))
+
+    return old_list_id, list_id, restored
+
+
+def set_summary_time(conn, user_id, summary_at):
+    return conn.execute('UPDATE users SET summary_at = ? WHERE user_id = ?', (summary_at, user_id)).rowcount > 0
+
+
+def claim_summaries(conn, now, day_end, next_time):
+    # One ordered pass finds every due user with today's reminders and the
+    # overdue ones (fired but never completed).
+    rows = conn.execute(f'''
+    SELECT u.user_id, u.summary_at, t.task, t.reminder_time, t.reminded 
+    FROM users u 
+    LEFT JOIN tasks t ON t.list_id = u.list_id 
+                     AND t.status != {COMPLETED} 
+                     AND t.reminder_time IS NOT NULL 
+                     AND (t.reminded = 1 OR t.reminder_time < ?) 
+    WHERE u.summary_at <= ? 
+    ORDER BY u.user_id, t.reminder_time, t.task_id
+    ''', (day_end, now)).fetchall()
+
+    summaries = []
+    updates = []
+    for user_id, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        updates.append((next_time(group[0][1]), user_id))
+        items = [(task_text, reminder_time, reminded) for _, _, task_text, reminder_time, reminded in group
+                 if task_text is not None]
+        if items:
+            summaries.append((user_id, items))
+
+    # Claimed and moved to the next day in the same transaction, so a summary
+    # is sent at most once even with several workers.
+    conn.executemany('UPDATE users SET summary_at = ? WHERE user_id = ?', updates)
+
+    return summaries
+
+
+def insert_tasks(conn, list_id, tasks, now):
+    conn.executemany('''
+    INSERT INTO tasks (list_id, task, description, status, created_at, completed_at, reminder_time, reminded)
+    VALUES (?, ?, ?, ?, ?, ?, NULL, 0)
+    ''', ((list_id, title, description, status, now, now if status == COMPLETED else None)
+          for title, description, status in tasks))
+    return len(tasks)
+
+
+def fetch_task(conn, list_id, task_id):
+    return conn.execute('''
+    SELECT task, description, status, reminder_time, reminded, reminder_rule 
+    FROM tasks 
+    WHERE task_id = ? AND list_id = ?
+    ''', (task_id, list_id)).fetchone()
+
+
+def update_task_status(conn, list_id, task_id, new_status):
+    conn.execute('''
+    UPDATE tasks 
+    SET status = ? 
+    WHERE task_id = ? AND list_id = ?
+    ''', (new_status, task_id, list_id))
+
+    return fetch_task(conn, list_id, task_id)
+
+
+def complete_task(conn, list_id, task_id, now):
+    conn.execute('''
+    UPDATE tasks 
+    SET status = ?, completed_at = ? 
+    WHERE task_id = ? AND list_id = ?
+    ''', (COMPLETED, now, task_id, list_id))
+
+    task = conn.execute('SELECT task FROM tasks WHERE task_id = ? AND list_id = ?', (task_id, list_id)).fetchone()
+    return task[0] if task else None
+
+
+def delete_task(conn, list_id, task_id):
+    task = conn.execute('SELECT task FROM tasks WHERE task_id = ? AND list_id = ?', (task_id, list_id)).fetchone()
+    if not task:
+        return None
+
+    conn.execute('DELETE FROM tasks WHERE task_id = ? AND list_id = ?', (task_id, list_id))
+
+    return task[0]
+
+
+def fetch_active_page(conn, list_id, page_size, anchor_id=None, backward=False):
+    order, compare = ('DESC', '<') if backward else ('ASC', '>')
+    limit = page_size + 1
+    rows = []
+    statuses = 'status < ?'
+    params = (COMPLETED,)
+
+    if anchor_id is not None:
+        anchor = conn.execute(
+            'SELECT status, created_at FROM tasks WHERE task_id = ? AND list_id = ? AND status < ?',
+            (anchor_id, list_id, COMPLETED)).fetchone()
+        if not anchor:
+            return [], False
+
+        status, created_at = anchor
+        rows = conn.execute(f'''
+        SELECT task_id, task, status, reminder_time, reminded 
+        FROM tasks 
+        WHERE list_id = ? AND status = ? AND (created_at, task_id) {compare} (?, ?)
+        ORDER BY created_at {order}, task_id {order}
+        LIMIT ?
+        ''', (list_id, status, created_at, anchor_id, limit)).fetchall()
+
+        if backward:
+            statuses, params = 'status < ?', (status,)
+        else:
+            statuses, params = 'status > ? AND status < ?', (status, COMPLETED)
+
+    if len(rows) < limit:
+        rows += conn.execute(f'''
+        SELECT task_id, task, status, reminder_time, reminded 
+        FROM tasks 
+        WHERE list_id = ? AND {statuses}
+        ORDER BY status {order}, created_at {order}, task_id {order}
+        LIMIT ?
+        ''', (list_id, *params, limit - len(rows))).fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return (rows[::-1] if backward else rows), has_more
+
+
+def fetch_completed_page(conn, list_id, page_size, anchor_id=None, backward=False):
+    # History spans the hot table and the archive; both are read with the same
+    # keyset on (completed_at, task_id) and merged, so a page can straddle them.
+    order, compare = ('ASC', '>') if backward else ('DESC', '<')
+    limit = page_size + 1
+    keyset = ''
+    params = ()
+
+    if anchor_id is not None:
+        anchor = conn.execute('''
+        SELECT completed_at FROM tasks WHERE task_id = ? AND list_id = ? AND status = ?
+        UNION ALL
+        SELECT completed_at FROM tasks_archive WHERE task_id = ? AND list_id = ?
+        ''', (anchor_id, list_id, COMPLETED, anchor_id, list_id)).fetchone()
+        if not anchor:
+            return [], False
+
+        keyset = f'AND (completed_at, task_id) {compare} (?, ?)'
+        params = (anchor[0], anchor_id)
+
+    rows = conn.execute(f'''
+    SELECT task_id, task, description, completed_at 
+    FROM tasks 
+    WHERE list_id = ? AND status = ? {keyset}
+    ORDER BY completed_at {order}, task_id {order}
+    LIMIT ?
+    ''', (list_id, COMPLETED, *params, limit)).fetchall()
+
+    rows += conn.execute(f'''
+    SELECT task_id, task, description, completed_at 
+    FROM tasks_archive 
+    WHERE list_id = ? {keyset}
+    ORDER BY completed_at {order}, task_id {order}
+    LIMIT ?
+    ''', (list_id, *params, limit)).fetchall()
+
+    rows.sort(key=lambda row: (row[3] or 0, row[0]), reverse=not backward)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return (rows[::-1] if backward else rows), has_more
+
+
+def search_tasks(conn, list_id, terms, limit, offset):
+    # User input never reaches MATCH verbatim: every term becomes a quoted
+    # prefix, so FTS5 operators and stray quotes can't break the query.
+    query = " ".join(f'"{term}"*' for term in terms)
+    rows = conn.execute('''
+    SELECT t.task_id, t.task, t.status, t.reminder_time, t.reminded 
+    FROM tasks_fts 
+    JOIN tasks t ON t.task_id = tasks_fts.rowid 
+    WHERE tasks_fts MATCH ? 
+    ORDER BY bm25(tasks_fts, 0.0, 10.0, 1.0), t.task_id 
+    LIMIT ? OFFSET ?
+    ''', (f'list_id : "{list_id}" AND {{task description}} : ({query})',
+          limit + 1, offset)).fetchall()
+
+    return rows[:limit], len(rows) > limit
+
+
+def export_tasks(conn, list_id, consume):
+    # Rows are handed over as the cursor yields them, so the full list is never in memory.
+    return consume(conn.execute('''
+    SELECT task, description, status, created_at, completed_at, reminder_time 
+    FROM tasks 
+    WHERE list_id = ?
+    UNION ALL
+    SELECT task, description, ?, created_at, completed_at, NULL 
+    FROM tasks_archive 
+    WHERE list_id = ?
+    ''', (list_id, COMPLETED, list_id)))
+
+
+FRESH_LIST_STATS = '''
+SELECT list_id, SUM(status = 0) AS in_progress, SUM(status = 1) AS not_started, 
+       SUM(status = 2 AND NOT archived) AS completed, SUM(archived) AS archived, 
+       SUM(reminded = 1 AND status != 2) AS overdue, 
+       SUM(status = 2 AND completed_at IS NOT NULL AND created_at IS NOT NULL) AS done_count, 
+       SUM(CASE WHEN status = 2 THEN IFNULL(completed_at - created_at, 0) ELSE 0 END) AS done_seconds 
+FROM (
+    SELECT list_id, status, reminded, created_at, completed_at, 0 AS archived FROM tasks 
+    UNION ALL 
+    SELECT list_id, 2, 0, created_at, completed_at, 1 FROM tasks_archive
+) 
+WHERE list_id IS NOT NULL 
+GROUP BY list_id
+'''
+
+
+def count_list_stats_drift(conn):
+    # Recomputes every aggregate from tasks and the archive and counts the rows
+    # that differ from what the triggers maintained. Read-only, so the full scan
+    # runs on a reader and never holds up the writer.
+    return conn.execute(f'''
+    WITH fresh_stats AS ({FRESH_LIST_STATS}) 
+    SELECT (
+        SELECT COUNT(*) FROM (
+            SELECT * FROM fresh_stats 
+            EXCEPT 
+            SELECT * FROM list_stats
+        )
+    ) + (
+        SELECT COUNT(*) FROM (
+            SELECT * FROM list_stats 
+            WHERE in_progress OR not_started OR completed OR archived OR overdue OR done_count OR done_seconds 
+            EXCEPT 
+            SELECT * FROM fresh_stats
+        )
+    )
+    ''').fetchone()[0]
+
+
+def rebuild_list_stats(conn):
+    # Writes may have landed since the reader saw the drift, so it is counted
+    # again inside the write before the table is replaced.
+    drift = count_list_stats_drift(conn)
+    if drift:
+        conn.execute('DELETE FROM list_stats')
+        conn.execute(f'INSERT INTO list_stats {FRESH_LIST_STATS}')
+    return drift
+
+
+def archive_completed(conn, before, limit):
+    task_ids = [(task_id,) for (task_id,) in conn.execute(f'''
+    SELECT task_id 
+    FROM tasks 
+    WHERE status = {COMPLETED} AND completed_at < ?
+    ORDER BY completed_at
+    LIMIT ?
+    ''', (before, limit))]
+
+    conn.executemany('''
+    INSERT OR REPLACE INTO tasks_archive (task_id, list_id, task, description, created_at, completed_at)
+    SELECT task_id, list_id, task, description, created_at, completed_at FROM tasks WHERE task_id = ?
+    ''', task_ids)
+    conn.executemany('DELETE FROM tasks WHERE task_id = ?', task_ids)
+    conn.executemany('DELETE FROM reminder_deliveries WHERE task_id = ?', task_ids)
+
+    return len(task_ids)
+
+
+def compact_archive(conn, before, limit):
+    return conn.execute('''
+    UPDATE tasks_archive SET description = NULL 
+    WHERE task_id IN (
+        SELECT task_id FROM tasks_archive 
+        WHERE completed_at < ? AND description IS NOT NULL 
+        LIMIT ?
+    )
+    ''', (before, limit)).rowcount
+
+
+def purge_archive(conn, before, limit):
+    return conn.execute('''
+    DELETE FROM tasks_archive 
+    WHERE task_id IN (SELECT task_id FROM tasks_archive WHERE completed_at < ? LIMIT ?)
+    ''', (before, limit)).rowcount
+
+
+def load_pending_reminders(conn, since=None):
+    rows = conn.execute('''
+    SELECT task_id, reminder_time 
+    FROM tasks 
+    WHERE reminder_time IS NOT NULL 
+      AND reminded = 0
+      AND reminder_time >= ?
+      AND status != ?
+    ''', (since or 0, COMPLETED))
+
+    return rows.fetchall()
+
+
+def fetch_overdue_reminders(conn, before, limit, after=None):
+    keyset = ''
+    params = ()
+    if after is not None:
+        keyset = 'AND (reminder_time, task_id) > (?, ?)'
+        params = after
+
+    return conn.execute(f'''
+    SELECT task_id, reminder_time 
+    FROM tasks 
+    WHERE reminder_time IS NOT NULL 
+      AND reminded = 0
+      AND reminder_time < ? {keyset}
+      AND status != ?
+    ORDER BY reminder_time, task_id
+    LIMIT ?
+    ''', (before, *params, COMPLETED, limit)).fetchall()
+
+
+def count_overdue_reminders(conn, before):
+    return conn.execute('''
+    SELECT COUNT(*) 
+    FROM tasks 
+    WHERE reminder_time IS NOT NULL 
+      AND reminded = 0
+      AND reminder_time < ?
+      AND status != ?
+    ''', (before, COMPLETED)).fetchone()[0]
+
+
+def update_reminder_time(conn, list_id, task_id, reminder_timestamp, reminder_rule=None):
+    task = conn.execute('SELECT task FROM tasks WHERE task_id = ? AND list_id = ?', (task_id, list_id)).fetchone()
+    if not task:
+        return None
+
+    conn.execute('''
+    UPDATE tasks 
+    SET reminder_time = ?, reminder_rule = ?, reminded = 0, reminder_owner = NULL, reminder_lease = NULL 
+    WHERE task_id = ? AND list_id = ?
+    ''', (reminder_timestamp, reminder_rule, task_id, list_id))
+
+    return task[0]
+
+
+def claim_reminder(conn, task_id, now, worker, lease_until):
+    # A reminder this worker already holds is being delivered right now (the
+    # sweep can re-schedule it before the first claim commits), so it is not
+    # claimable again until the lease is released or runs out.
+    task = conn.execute('''
+    UPDATE tasks 
+    SET reminder_owner = ?, reminder_lease = ? 
+    WHERE task_id = ? 
+      AND reminder_time IS NOT NULL 
+      AND reminder_time <= ?
+      AND reminded = 0
+      AND status != ?
+      AND (reminder_owner IS NULL OR reminder_lease < ?)
+    RETURNING list_id, task, reminder_time, reminder_rule
+    ''', (worker, lease_until, task_id, now, COMPLETED, now)).fetchone()
+
+    if not task:
+        return None
+
+    list_id, task_text, reminder_time, reminder_rule = task
+
+    # Members that a crashed worker already reached are skipped on reclaim.
+    delivered = {user_id for (user_id,) in conn.execute('''
+    SELECT user_id FROM reminder_deliveries WHERE task_id = ? AND reminder_time = ?
+    ''', (task_id, reminder_time))}
+
+    return list_id, task_text, reminder_time, reminder_rule, delivered
+
+
+def record_delivery(conn, task_id, reminder_time, user_id, worker, lease_until):
+    conn.execute('''
+    INSERT OR IGNORE INTO reminder_deliveries (task_id, reminder_time, user_id) VALUES (?, ?, ?)
+    ''', (task_id, reminder_time, user_id))
+
+    return conn.execute('''
+    UPDATE tasks SET reminder_lease = ? WHERE task_id = ? AND reminder_owner = ?
+    ''', (lease_until, task_id, worker)).rowcount > 0
+
+
+def finish_reminder(conn, task_id, worker, next_time=None):
+    if next_time is None:
+        finished = conn.execute('''
+        UPDATE tasks 
+        SET reminded = 1, reminder_owner = NULL, reminder_lease = NULL 
+        WHERE task_id = ? AND reminder_owner = ?
+        ''', (task_id, worker)).rowcount
+    else:
+        finished = conn.execute('''
+        UPDATE tasks 
+        SET reminder_time = ?, reminded = 0, reminder_owner = NULL, reminder_lease = NULL 
+        WHERE task_id = ? AND reminder_owner = ?
+        ''', (next_time, task_id, worker)).rowcount
+
+    # A worker that lost its lease must leave the new owner's delivery log alone.
+    if finished:
+        conn.execute('DELETE FROM reminder_deliveries WHERE task_id = ?', (task_id,))
+    return finished > 0
+
+
+def renew_reminder_leases(conn, worker, lease_until):
+    conn.execute('''
+    UPDATE tasks SET reminder_lease = ? WHERE reminder_owner = ?
+    ''', (lease_until, worker))
+
+
+def release_reminder_leases(conn, worker):
+    return conn.execute('''
+    UPDATE tasks SET reminder_owner = NULL, reminder_lease = NULL WHERE reminder_owner = ?
+    ''', (worker,)).rowcount
+
+
+def find_claimable_reminders(conn, now, horizon, since=None):
+    return conn.execute('''
+    SELECT task_id, reminder_time 
+    FROM tasks 
+    WHERE reminder_time IS NOT NULL 
+      AND reminded = 0
+      AND reminder_time BETWEEN ? AND ?
+      AND status != ?
+      AND (reminder_owner IS NULL OR reminder_lease < ?)
+    ''', (since or 0, now + horizon, COMPLETED, now)).fetchall()
+
+
+class SQLiteRepository(TaskRepository):
+    def __init__(self, path, on_query=None, on_commit=None):
+        ensure_schema(path)
+        self.db = Database(path, on_query=on_query, on_commit=on_commit)
+
+    async def user_list(self, user_id):
+        return await self.db.read(fetch_user_list, user_id)
+
+    async def list_members(self, list_id):
+        return await self.db.read(fetch_list_members, list_id)
+
+    async def create_user_list(self, user_id):
+        await self.db.write(create_user_list, user_id)
+
+    async def create_invite(self, list_id, user_id, now, ttl):
+        return await self.db.write(create_invite, list_id, user_id, now, ttl)
+
+    async def join_list(self, user_id, token, now):
+        return await self.db.write(join_list, user_id, token, now)
+
+    async def leave_list(self, user_id):
+        return await self.db.write(leave_list, user_id)
+
+    async def summary_time(self, user_id):
+        return await self.db.read(fetch_summary_time, user_id)
+
+    async def set_summary_time(self, user_id, summary_at):
+        return await self.db.write(set_summary_time, user_id, summary_at)
+
+    async def claim_summaries(self, now, day_end, next_time):
+        return await self.db.write(claim_summaries, now, day_end, next_time)
+
+    async def add_task(self, list_id, title, description, status, created_at):
+        return await self.db.write(insert_task, list_id, title, description, status, created_at)
+
+    async def add_tasks(self, list_id, tasks, now):
+        return await self.db.write(insert_tasks, list_id, tasks, now)
+
+    async def get_task(self, list_id, task_id):
+        return await self.db.read(fetch_task, list_id, task_id)
+
+    async def rename_task(self, list_id, task_id, title):
+        return await self.db.write(rename_task, list_id, task_id, title)
+
+    async def set_description(self, list_id, task_id, description):
+        return await self.db.write(update_description, list_id, task_id, description)
+
+    async def set_status(self, list_id, task_id, status):
+        return await self.db.write(update_task_status, list_id, task_id, status)
+
+    async def complete_task(self, list_id, task_id, now):
+        return await self.db.write(complete_task, list_id, task_id, now)
+
+    async def delete_task(self, list_id, task_id):
+        return await self.db.write(delete_task, list_id, task_id)
+
+    async def active_page(self, list_id, limit, anchor_id=None, backward=False):
+        return await self.db.read(fetch_active_page, list_id, limit, anchor_id, backward)
+
+    async def completed_page(self, list_id, limit, anchor_id=None, backward=False):
+        return await self.db.read(fetch_completed_page, list_id, limit, anchor_id, backward)
+
+    async def search_tasks(self, list_id, terms, limit, offset):
+        return await self.db.read(search_tasks, list_id, terms, limit, offset)
+
+    async def export_tasks(self, list_id, consume):
+        return await self.db.read(export_tasks, list_id, consume)
+
+    async def list_stats(self, list_id):
+        return await self.db.read(fetch_list_stats, list_id)
+
+    async def check_list_stats(self):
+        if not await self.db.read(count_list_stats_drift):
+            return 0
+        return await self.db.write(rebuild_list_stats)
+
+    async def archive_completed(self, before, limit):
+        return await self.db.write(archive_completed, before, limit)
+
+    async def compact_archive(self, before, limit):
+        return await self.db.write(compact_archive, before, limit)
+
+    async def purge_archive(self, before, limit):
+        return await self.db.write(purge_archive, before, limit)
+
+    async def pending_reminders(self, since=None):
+        return await self.db.read(load_pending_reminders, since)
+
+    async def overdue_reminders(self, before, limit, after=None):
+        return await self.db.read(fetch_overdue_reminders, before, limit, after)
+
+    async def count_overdue_reminders(self, before):
+        return await self.db.read(count_overdue_reminders, before)
+
+    async def set_reminder(self, list_id, task_id, reminder_time, rule=None):
+        return await self.db.write(update_reminder_time, list_id, task_id, reminder_time, rule)
+
+    async def claim_reminder(self, task_id, now, worker, lease_until):
+        return await self.db.write(claim_reminder, task_id, now, worker, lease_until)
+
+    async def record_delivery(self, task_id, reminder_time, user_id, worker, lease_until):
+        return await self.db.write(record_delivery, task_id, reminder_time, user_id, worker, lease_until)
+
+    async def finish_reminder(self, task_id, worker, next_time=None):
+        return await self.db.write(finish_reminder, task_id, worker, next_time)
+
+    async def renew_reminder_leases(self, worker, lease_until):
+        await self.db.write(renew_reminder_leases, worker, lease_until)
+
+    async def release_reminder_leases(self, worker):
+        return await self.db.write(release_reminder_leases, worker)
+
+    async def claimable_reminders(self, now, horizon, since=None):
+        return await self.db.read(find_claimable_reminders, now, horizon, since)
+
+    def fsm_storage(self):
+        return SQLiteStorage(self.db)
+
+    async def close(self):
+        await self.db.flush()
+        self.db.close()
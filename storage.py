@@ -0,0 +1,133 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db, ttl=7 * 24 * 3600, cache_size=100000, flush_interval=0.5, purge_interval=3600):
+        self.db = db
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._flusher = None
+        self._last_purge = time.time()
+
+    @staticmethod
+    def _key(key):
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.business_connection_id or ''}:{key.destiny}"
+
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key):
+        now = int(time.time())
+        record = self._cache.get(key) or self._dirty.get(key)
+
+        if record is None:
+            row = await self.db.fetchone('SELECT state, data, updated_at FROM fsm_state WHERE key = ?', (key,))
+            # Another coroutine may have loaded the same key while we were waiting.
+            record = self._cache.get(key) or self._dirty.get(key)
+            if record is None:
+                record = [row[0], json.loads(row[1]), row[2]] if row else [None, {}, now]
+
+        if record[2] + self.ttl < now:
+            record = [None, {}, now]
+            self._dirty[key] = record
+            self._start_flusher()
+
+        self._remember(key, record)
+        return record
+
+    def _touch(self, key, record):
+        record[2] = int(time.time())
+        self._dirty[key] = record
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # A failed write (e.g. another process holding the write lock) must not
+        # end the loop: flush() has already put the records back for the next
+        # round.
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                try:
+                    await self.flush()
+                    if time.time() - self._last_purge > self.purge_interval:
+                        await self.purge()
+                except Exception as e:
+                    print(f"Ошибка при сохранении состояний: {e}")
+        finally:
+            if self._flusher is asyncio.current_task():
+                self._flusher = None
+
+    async def flush(self):
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        upserts = [(key, state, json.dumps(data, ensure_ascii=False), touched)
+                   for key, (state, data, touched) in dirty.items() if state is not None or data]
+        deletes = [(key,) for key, (state, data, touched) in dirty.items() if state is None and not data]
+
+        def write(conn):
+            conn.executemany('''
+            INSERT INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data,
+                                            updated_at = excluded.updated_at
+            ''', upserts)
+            conn.executemany('DELETE FROM fsm_state WHERE key = ?', deletes)
+
+        try:
+            await self.db.write(write)
+        except BaseException:
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            raise
+
+    async def purge(self):
+        self._last_purge = time.time()
+        expired = self._last_purge - self.ttl
+        await self.db.execute('DELETE FROM fsm_state WHERE updated_at < ?', (expired,))
+        for key in [key for key, record in self._cache.items() if record[2] < expired]:
+            del self._cache[key]
+
+    async def set_state(self, key, state=None):
+        key = self._key(key)
+        record = await self._load(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key):
+        return (await self._load(self._key(key)))[0]
+
+    async def set_data(self, key, data):
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        key = self._key(key)
+        record = await self._load(key)
+        record[1] = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key):
+        return (await self._load(self._key(key)))[1].copy()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,332 @@
+import asyncio
+import itertools
+import sqlite3
+import time
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+import Main
+from callbacks import Action, encode
+from config import load_config
+from fake_telegram import FakeSession, make_update
+from memory_repository import MemoryRepository
+from repository import STATUS_CODES
+from sqlite_repository import SQLiteRepository
+
+IN_PROGRESS = STATUS_CODES["in_progress"]
+NOT_STARTED = STATUS_CODES["not_started"]
+COMPLETED = STATUS_CODES["completed"]
+TOKEN = "123456:" + "A" * 35
+NOW = 1_700_000_000
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def repo(request, tmp_path):
+    repo = SQLiteRepository(str(tmp_path / "tasks.db")) if request.param == "sqlite" else MemoryRepository()
+    yield repo
+    run(repo.close())
+
+
+async def new_list(repo, user_id="1"):
+    await repo.create_user_list(user_id)
+    return await repo.user_list(user_id)
+
+
+def test_active_pages_follow_keyset_order(repo):
+    async def check():
+        list_id = await new_list(repo)
+        ids = [await repo.add_task(list_id, f"task {i}", None, NOT_STARTED, NOW + i) for i in range(7)]
+        await repo.set_status(list_id, ids[5], IN_PROGRESS)
+        await repo.complete_task(list_id, ids[6], NOW + 10)
+        order = [ids[5], *ids[:5]]
+
+        rows, has_more = await repo.active_page(list_id, 4)
+        assert [row[0] for row in rows] == order[:4] and has_more
+        rows, has_more = await repo.active_page(list_id, 4, rows[-1][0])
+        assert [row[0] for row in rows] == order[4:] and not has_more
+        rows, has_more = await repo.active_page(list_id, 2, order[4], backward=True)
+        assert [row[0] for row in rows] == order[2:4] and has_more
+        rows, has_more = await repo.active_page(list_id, 4, order[2], backward=True)
+        assert [row[0] for row in rows] == order[:2] and not has_more
+        assert await repo.active_page(list_id, 4, ids[6]) == ([], False)
+
+        rows, has_more = await repo.completed_page(list_id, 4)
+        assert [row[0] for row in rows] == [ids[6]] and not has_more
+
+    run(check())
+
+
+def test_completed_pages_span_the_archive(repo):
+    async def check():
+        list_id = await new_list(repo)
+        ids = [await repo.add_task(list_id, f"task {i}", f"note {i}", NOT_STARTED, NOW) for i in range(6)]
+        for i, task_id in enumerate(ids):
+            await repo.complete_task(list_id, task_id, NOW + 10 * i)
+        assert await repo.archive_completed(NOW + 25, 10) == 3
+        newest = ids[::-1]
+
+        rows, has_more = await repo.completed_page(list_id, 4)
+        assert [row[0] for row in rows] == newest[:4] and has_more
+        rows, has_more = await repo.completed_page(list_id, 4, rows[-1][0])
+        assert [row[0] for row in rows] == newest[4:] and not has_more
+        rows, has_more = await repo.completed_page(list_id, 2, newest[4], backward=True)
+        assert [row[0] for row in rows] == newest[2:4] and has_more
+        assert await repo.completed_page(list_id, 4, 999) == ([], False)
+
+        assert await repo.compact_archive(NOW + 15, 10) == 2
+        assert await repo.compact_archive(NOW + 15, 10) == 0
+        rows, _ = await repo.completed_page(list_id, 6)
+        assert [row[2] for row in rows] == ["note 5", "note 4", "note 3", "note 2", None, None]
+        assert await repo.purge_archive(NOW + 25, 1) == 1
+        assert await repo.purge_archive(NOW + 25, 10) == 2
+        rows, _ = await repo.completed_page(list_id, 6)
+        assert [row[0] for row in rows] == newest[:3]
+
+    run(check())
+
+
+def test_search_matches_prefixes_title_first(repo):
+    async def check():
+        list_id = await new_list(repo)
+        milk = await repo.add_task(list_id, "Купить молоко", None, NOT_STARTED, NOW)
+        report = await repo.add_task(list_id, "Отчёт", "молоко к обеду", NOT_STARTED, NOW)
+        await repo.add_task(list_id, "Позвонить", None, NOT_STARTED, NOW)
+
+        rows, has_more = await repo.search_tasks(list_id, ["молок"], 10, 0)
+        assert [row[0] for row in rows] == [milk, report] and not has_more
+        rows, has_more = await repo.search_tasks(list_id, ["молок"], 1, 0)
+        assert [row[0] for row in rows] == [milk] and has_more
+        rows, _ = await repo.search_tasks(list_id, ["куп", "мол"], 10, 0)
+        assert [row[0] for row in rows] == [milk]
+        assert await repo.search_tasks(list_id, ["хлеб"], 10, 0) == ([], False)
+
+        # ё is indexed as е, and Main.search_terms folds queries the same way.
+        tree = await repo.add_task(list_id, "Ёлку нарядить", None, NOT_STARTED, NOW)
+        rows, _ = await repo.search_tasks(list_id, Main.search_terms("ёлку"), 10, 0)
+        assert [row[0] for row in rows] == [tree]
+        rows, _ = await repo.search_tasks(list_id, Main.search_terms("елку"), 10, 0)
+        assert [row[0] for row in rows] == [tree]
+        await repo.rename_task(list_id, report, "Отчёт за квартал")
+        rows, _ = await repo.search_tasks(list_id, Main.search_terms("отчет квартал"), 10, 0)
+        assert [row[0] for row in rows] == [report]
+        await repo.delete_task(list_id, tree)
+        assert await repo.search_tasks(list_id, ["елк"], 10, 0) == ([], False)
+
+    run(check())
+
+
+def test_stats_follow_changes_and_archive(repo):
+    async def check():
+        list_id = await new_list(repo)
+        ids = [await repo.add_task(list_id, f"task {i}", None, NOT_STARTED, NOW) for i in range(4)]
+        await repo.set_status(list_id, ids[0], IN_PROGRESS)
+        await repo.complete_task(list_id, ids[1], NOW + 60)
+        await repo.complete_task(list_id, ids[2], NOW + 120)
+        await repo.delete_task(list_id, ids[3])
+        assert await repo.list_stats(list_id) == (1, 0, 2, 0, 0, 2, 180)
+
+        assert await repo.archive_completed(NOW + 100, 10) == 1
+        assert await repo.archive_completed(NOW + 1000, 10) == 1
+        assert await repo.archive_completed(NOW + 1000, 10) == 0
+        assert await repo.list_stats(list_id) == (1, 0, 0, 2, 0, 2, 180)
+        rows, _ = await repo.completed_page(list_id, 10)
+        assert [row[0] for row in rows] == [ids[2], ids[1]]
+        assert await repo.check_list_stats() == 0
+
+    run(check())
+
+
+def test_sqlite_stats_drift_is_rebuilt(tmp_path):
+    async def check():
+        repo = SQLiteRepository(str(tmp_path / "tasks.db"))
+        list_id = await new_list(repo)
+        await repo.add_task(list_id, "task", None, NOT_STARTED, NOW)
+        expected = await repo.list_stats(list_id)
+
+        def corrupt(conn):
+            conn.execute('UPDATE list_stats SET not_started = 5')
+        await repo.db.write(corrupt)
+        assert await repo.check_list_stats() == 2
+        assert await repo.list_stats(list_id) == expected
+        assert await repo.check_list_stats() == 0
+        await repo.close()
+
+    run(check())
+
+
+def test_leaving_a_shared_list_restores_the_home_list(repo):
+    async def check():
+        shared = await new_list(repo, "1")
+        home = await new_list(repo, "2")
+        task_id = await repo.add_task(home, "own task", None, NOT_STARTED, NOW)
+        token = await repo.create_invite(shared, "1", NOW, 3600)
+
+        assert await repo.join_list("2", token, NOW) == (shared, home)
+        assert sorted(await repo.list_members(shared)) == ["1", "2"]
+        assert await repo.leave_list("2") == (shared, home, True)
+        assert await repo.user_list("2") == home
+        assert await repo.list_members(home) == ("2",)
+        assert await repo.get_task(home, task_id)
+
+        assert await repo.leave_list("2") is None
+
+        # The list's creator has no home list to return to and gets a new one.
+        await repo.join_list("2", token, NOW)
+        assert await repo.leave_list("1") == (shared, await repo.user_list("1"), False)
+        assert await repo.user_list("1") not in (shared, home)
+
+    run(check())
+
+
+def test_fsm_storage_survives_a_failed_write(tmp_path):
+    async def check():
+        repo = SQLiteRepository(str(tmp_path / "tasks.db"))
+        storage = repo.fsm_storage()
+        storage.flush_interval = 0.01
+        key = StorageKey(bot_id=1, chat_id=2, user_id=2)
+        write = repo.db.write
+        failures = []
+
+        async def fail_once(fn, *args):
+            if not failures:
+                failures.append(fn)
+                raise sqlite3.OperationalError("database is locked")
+            return await write(fn, *args)
+
+        repo.db.write = fail_once
+        await storage.set_state(key, "first")
+        await asyncio.sleep(0.1)
+        await storage.set_state(key, "second")
+        await asyncio.sleep(0.1)
+        assert failures and not storage._dirty
+        assert await repo.db.fetchone('SELECT state FROM fsm_state') == ("second",)
+        await storage.close()
+        await repo.close()
+
+    run(check())
+
+
+def test_reminder_claims_and_leases(repo):
+    async def check():
+        list_id = await new_list(repo)
+        task_id = await repo.add_task(list_id, "call", None, NOT_STARTED, NOW)
+        await repo.set_reminder(list_id, task_id, NOW)
+
+        assert await repo.claimable_reminders(NOW, 60) == [(task_id, NOW)]
+        assert await repo.claim_reminder(task_id, NOW, "a", NOW + 30) == (list_id, "call", NOW, None, set())
+        # Neither another worker nor the holder itself may claim it while leased.
+        assert await repo.claim_reminder(task_id, NOW + 1, "b", NOW + 31) is None
+        assert await repo.claim_reminder(task_id, NOW + 1, "a", NOW + 31) is None
+        assert await repo.claimable_reminders(NOW + 1, 60) == []
+        assert await repo.record_delivery(task_id, NOW, "1", "a", NOW + 30)
+
+        # Once the lease runs out another worker takes over and skips
+        # members already reached; the old holder can no longer finish.
+        claim = await repo.claim_reminder(task_id, NOW + 31, "b", NOW + 60)
+        assert claim[-1] == {"1"}
+        assert not await repo.record_delivery(task_id, NOW, "2", "a", NOW + 60)
+        assert await repo.record_delivery(task_id, NOW, "3", "b", NOW + 60)
+        # The old holder's finish fails and leaves b's delivery log intact for
+        # whoever reclaims after b.
+        assert not await repo.finish_reminder(task_id, "a")
+        claim = await repo.claim_reminder(task_id, NOW + 61, "c", NOW + 90)
+        assert claim[-1] == {"1", "2", "3"}
+        assert not await repo.finish_reminder(task_id, "b")
+        assert await repo.release_reminder_leases("c") == 1
+        assert await repo.claim_reminder(task_id, NOW + 61, "b", NOW + 3600)
+        assert await repo.finish_reminder(task_id, "b", NOW + 3600)
+        assert await repo.pending_reminders() == [(task_id, NOW + 3600)]
+
+        assert await repo.claim_reminder(task_id, NOW + 3600, "b", NOW + 3630)
+        assert await repo.release_reminder_leases("b") == 1
+        assert await repo.claim_reminder(task_id, NOW + 3600, "a", NOW + 3630)
+        assert await repo.finish_reminder(task_id, "a")
+        assert await repo.pending_reminders() == []
+
+    run(check())
+
+
+def test_overdue_reminders_page_in_due_order(repo):
+    async def check():
+        list_id = await new_list(repo)
+        ids = [await repo.add_task(list_id, f"task {i}", None, NOT_STARTED, NOW) for i in range(5)]
+        for i, task_id in enumerate(ids):
+            await repo.set_reminder(list_id, task_id, NOW - 100 * (i % 3))
+        await repo.complete_task(list_id, ids[0], NOW)
+
+        assert await repo.count_overdue_reminders(NOW) == 3
+        first = await repo.overdue_reminders(NOW, 2)
+        assert first == [(ids[2], NOW - 200), (ids[1], NOW - 100)]
+        rest = await repo.overdue_reminders(NOW, 2, first[-1][::-1])
+        assert rest == [(ids[4], NOW - 100)]
+        assert await repo.pending_reminders(NOW - 100) == [(ids[1], NOW - 100), (ids[4], NOW - 100), (ids[3], NOW)]
+
+    run(check())
+
+
+@pytest.fixture(scope="module")
+def app():
+    Main.create_app(load_config(["--api-token", TOKEN, "--backend", "memory", "--throttle-rate", "0",
+                                 "--reminder-digest-window", "0"], environ={}))
+    sent = []
+    Main.bot.session = FakeSession(on_request=lambda method, params: sent.append((method, params)))
+    return sent
+
+
+def test_handlers_on_memory_backend(app):
+    update_ids = itertools.count(1)
+
+    async def feed(user_id, text=None, data=None):
+        if data:
+            update = {"update_id": next(update_ids), "callback_query": {
+                "id": str(next(update_ids)), "chat_instance": "c", "data": data,
+                "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+                "message": {"message_id": 1, "date": 1, "chat": {"id": user_id, "type": "private"}, "text": "-"}}}
+        else:
+            update = make_update(next(update_ids), user_id, text)
+        result = await Main.dp.feed_update(Main.bot, Update.model_validate(update, context={"bot": Main.bot}))
+        if isinstance(result, TelegramMethod):
+            await Main.bot(result)
+        return next(params["text"] for method, params in reversed(app) if method in ("sendMessage", "editMessageText"))
+
+    async def check():
+        await feed(5, "/start")
+        await feed(5, "➕ Добавить")
+        await feed(5, "\n".join(f"купить {i}" for i in range(12)))
+        list_id = await Main.repo.user_list("5")
+        rows, has_more = await Main.repo.active_page(list_id, Main.PAGE_SIZE)
+        assert len(rows) == Main.PAGE_SIZE and has_more
+
+        assert "купить 0" in await feed(5, "📋 Список")
+        page = await feed(5, data=encode(Action.PAGE_ACTIVE, 1, rows[-1][0], 0))
+        assert "купить 10" in page and "купить 0" not in page
+
+        await feed(5, data=encode(Action.CONFIRM_DONE, rows[0][0]))
+        assert "купить 0" in await feed(5, "✅ Выполненные")
+        assert (await Main.repo.list_stats(list_id))[:3] == (0, 11, 1)
+        assert "купить 3" in await feed(5, "/search купить 3")
+
+        due = int(time.time())
+        await Main.repo.set_reminder(list_id, rows[1][0], due)
+        await Main.send_reminder(rows[1][0], due)
+        assert app[-1][1]["text"] == "⏰ Напоминание: купить 1"
+        assert await Main.repo.pending_reminders() == []
+
+        # A failed send leaves the reminder pending, unrecorded and leased.
+        session = Main.bot.session
+        Main.bot.session = None
+        await Main.repo.set_reminder(list_id, rows[2][0], due)
+        await Main.send_reminder(rows[2][0], due)
+        Main.bot.session = session
+        assert await Main.repo.pending_reminders() == [(rows[2][0], due)]
+        assert await Main.repo.claim_reminder(rows[2][0], due + Main.config.reminder_lease + 1, "other", due + 3600) == (
+            list_id, "купить 2", due, None, set())
+
+    run(check())
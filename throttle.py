@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from outbox import TokenBucket
+
+
+class Throttle(BaseMiddleware):
+    def __init__(self, registry, rate=2, burst=20, max_delay=2.0, costs=None, handler_name=None):
+        # Each user has a bucket of `burst` tokens refilled at `rate` per second;
+        # a handler costs costs[name] tokens (1 by default). Requests that fit
+        # within max_delay are deferred until their tokens are there, the rest
+        # are dropped.
+        self.rate = rate
+        self.burst = burst
+        self.max_delay = max_delay
+        self.costs = costs or {}
+        self.handler_name = handler_name
+        self.throttled = registry.counter("bot_throttled_total", "Updates deferred, dropped or coalesced.",
+                                          ("handler", "outcome"))
+        self._buckets = {}
+        self._in_flight = set()
+        self._warned = set()
+
+    def _bucket(self, user_id, now):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                for key in [key for key, bucket in self._buckets.items() if bucket.full(now)]:
+                    del self._buckets[key]
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _reject(self, event, user_id):
+        if isinstance(event, CallbackQuery):
+            return event.answer("⏳ Слишком часто, подождите немного" if user_id else None)
+        # Messages get one warning per flood rather than one per dropped update.
+        if user_id is not None and user_id not in self._warned:
+            self._warned.add(user_id)
+            return event.answer("⏳ Слишком много запросов, подождите немного.")
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or not self.rate:
+            return await handler(event, data)
+
+        name = (self.handler_name and self.handler_name(event, data)) or data["handler"].callback.__name__
+        # A repeat of a request that is still being handled (a double-tapped
+        # button, "📋 Список" sent twice) is answered by the first one.
+        key = (user.id, name, event.data if isinstance(event, CallbackQuery) else event.text)
+        if key in self._in_flight:
+            self.throttled.inc(name, "coalesced")
+            return self._reject(event, None)
+
+        now = time.monotonic()
+        cost = min(self.costs.get(name, 1), self.burst)
+        bucket = self._bucket(user.id, now)
+        delay = bucket.delay(now, cost)
+        if delay > self.max_delay:
+            self.throttled.inc(name, "dropped")
+            return self._reject(event, user.id)
+
+        # Tokens are reserved up front, so requests arriving during the wait
+        # queue up behind this one instead of all waking at the same moment.
+        bucket.take(now, cost)
+        self._in_flight.add(key)
+        try:
+            if delay:
+                self.throttled.inc(name, "deferred")
+                await asyncio.sleep(delay)
+            self._warned.discard(user.id)
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
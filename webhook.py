@@ -0,0 +1,40 @@
+import asyncio
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher, bot, max_in_flight=100, **kwargs):
+        # Updates are processed while Telegram waits for the response, so a
+        # handler that returns a method (e.g. message.answer(...)) is sent back
+        # inline instead of costing a separate API call.
+        super().__init__(dispatcher, bot, handle_in_background=False, **kwargs)
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    async def handle(self, request):
+        async with self._slots:
+            return await super().handle(request)
+
+    __call__ = handle
+
+
+async def run_webhook(dispatcher, bot, base_url, host="127.0.0.1", port=8080, path="/webhook",
+                      max_in_flight=100, secret_token=None, stop=None):
+    app = web.Application()
+    LimitedRequestHandler(dispatcher, bot, max_in_flight, secret_token=secret_token).register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    await bot.set_webhook(f"{base_url}{path}", secret_token=secret_token,
+                          max_connections=min(max_in_flight, 100),
+                          allowed_updates=dispatcher.resolve_used_update_types())
+    try:
+        await (stop or asyncio.Event()).wait()
+    finally:
+        # Waits for requests already being handled; the webhook itself stays
+        # registered so Telegram keeps the updates that arrive during a restart.
+        await runner.cleanup()